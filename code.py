@@ -4,6 +4,7 @@ import os
 import usb_cdc
 import json
 from broker import Glob, IO # custom broker library
+from time import monotonic_ns
 from scribe import Scribe
 
 # global variables
@@ -22,9 +23,11 @@ def load_definition(glob,file=None):
             glob.cfg.remove()
             glob.cfg.add(def_obj['cfg'])
         verbose = glob.cfg.resolve('verbose',False)
+        glob.heap.enable(glob.cfg.resolve('heap',False))
         if verbose: scribe('load_definition: configuration processed')
         if 'io' in def_obj:
             glob.io = IO(def_obj['io'],verbose)
+            glob.io.buses.budget = glob.cfg.resolve('budget',20)
         if verbose: scribe('load_definition: i/o processed')
         if 'jobs' in def_obj:
             glob.cron.jobs.flush(True)
@@ -67,6 +70,7 @@ def check_for_messages(serial, glob):
                         glob.rtn.push({'tag': 'ack', 'ack': mtype, 'ref': ref, 'err': None})   # receipt!
             except Exception as e:
                 scribe(f'ERROR[{type(e)}]: {line}\n  {e}')
+                glob.error('json')
                 if not quiet:
                     glob.rtn.push({'tag': 'err', 'err': e, 'line': line})
 
@@ -136,7 +140,20 @@ def execute_command(msg, glob):
         rtnMsg['state'] = globals()['loopInterrupt']
     elif cmd=='info':
         rtnMsg['info'] = {'os': os.uname(), 'time': glob.utc.timeAs}
+    elif cmd=='metrics':
+        # snapshot, or changes since last delta read, optionally filtered by name prefix
+        rtnMsg['metrics'] = glob.metrics.read(msg.get('prefix'),msg.get('delta',False))
+        if msg.get('reset'):
+            glob.metrics.reset(msg.get('prefix'))
+    elif cmd=='mem':
+        # heap use and heaviest allocating loop phases/drivers; sampling enabled by cfg.heap or here
+        if 'enable' in msg:
+            glob.heap.enable(msg['enable'])
+        rtnMsg['mem'] = glob.heap.report(msg.get('top',5))
+        if msg.get('reset'):
+            glob.heap.reset()
     else:
+        glob.error('cmd')
         if not glob.cfg.quiet:
             rtnMsg['err'] = "Unrecognized command!"
             rtmMsg['msg'] = msg
@@ -145,6 +162,7 @@ def execute_command(msg, glob):
 # sorts out input messages and events into commands and actions...
 def sift_messages_and_events(glob):
     cfg_trace = glob.cfg.resolve('trace',False)
+    actions = []    # action msgs of this pass, routed together so drivers may batch them
     for src in [glob.msgs, glob.events]:
         while src.available:
             msg = src.pull()
@@ -155,16 +173,19 @@ def sift_messages_and_events(glob):
             elif msg.get('id',None):
                 if cfg_trace:
                     scribe(f"trace[*handle]: {msg.get('id')}")
-                action = glob.io.handle(msg,cfg_trace)
-                if cfg_trace:
-                    scribe(f"trace[handle*]: {msg.get('id')}")
-                if action:
-                    glob.rtn.push(action)
+                actions.append(msg)
             # otherwise unknown
             else:
+                glob.error('msg')
                 if not glob.cfg.quiet:
                     msg['err'] = "Unrecognized message!"
                     glob.rtn.push(msg)
+    if actions:
+        results = glob.io.handle_batch(actions,cfg_trace)
+        if cfg_trace:
+            scribe(f"trace[handle*]: {len(actions)} actions")
+        if results:
+            glob.rtn.push(results)
 
 def process_pending_actions(glob):
     trace = glob.cfg.resolve('trace',False)
@@ -188,12 +209,20 @@ if glob.cfg.resolve('ready',False):
     scribe(f"Ready notice: {msg}")
 
 scribe("Begin service loop...")
+glob.metrics.histogram('loop.ms',(1,2,5,10,20,50,100,200,500,1000))
 while not exit:
+    start = monotonic_ns()
+    mark = glob.heap.start()
     check_for_messages(serial, glob)
+    mark = glob.heap.lap('loop.recv', mark)
     check_cronjobs(glob)
+    mark = glob.heap.lap('loop.cron', mark)
     sift_messages_and_events(glob)
+    mark = glob.heap.lap('loop.sift', mark)
     process_pending_actions(glob)
+    mark = glob.heap.lap('loop.poll', mark)
     return_results(serial, glob)
+    glob.heap.lap('loop.send', mark)
     if loopInterrupt:
         if loopInterrupt=='reload':
             scribe('Executing reload...')
@@ -203,6 +232,8 @@ while not exit:
             glob.utc.sleep(2)
             microcontroller.reset()
         exit = (loopInterrupt=='exit')
+    glob.metrics.count('loop')
+    glob.metrics.observe('loop.ms',(monotonic_ns()-start)//1000000)
     glob.utc.sleep(0.01)
 
 scribe("Execution halted!")
@@ -6,14 +6,19 @@ Library for QTPy Broker
 import sys
 import json
 import board
+from time import monotonic_ns
 # from nvstore import NVStore
 from timeplus import Zulutime, Cron
 from simpleq import Queue
+from metrics import metrics, heap
 from drivers import *
 
 from scribe import Scribe
 scribe = Scribe('BRKR').scribe
 
+def millis():
+    return monotonic_ns() // 1000000
+
 # Configuration/Definition class object for simpler dot notation references
 class Definition:
 
@@ -68,6 +73,9 @@ class IO:
         self.verbose = verbose
         self.interfaces = {}
         self.instances = {}
+        self.schedule = []      # (interface, due, lap) entries; due==None means poll every loop
+        self.laps = {}          # interface name -> (handle, poll) heap section names, built once
+        self.buses = BusScheduler() # interleaved shared bus drivers, e.g. several OneWire buses
         if obj:
             self.add([d for i,d in enumerate(obj) if 'driver' in d])
             self.add([x for i,x in enumerate(obj) if 'interface' in x])
@@ -95,6 +103,11 @@ class IO:
                     else:
                         scribe(f"{driver}[{name}]: {dir(dx)}")
                         self.interfaces[name] = dx(obj, verbose)
+                        self.laps[name] = (name+'.handle', name+'.poll')
+                        if getattr(dx,'INTERLEAVE',False):
+                            self.buses.add(self.interfaces[name], self.laps[name][1])
+                        self.schedule = [(i, getattr(i,'due',None), self.laps[n][1]) for n, i in self.interfaces.items()
+                            if not i in self.buses.drivers]
                         scribe(f"Driver[{driver}] {name} defined!")
                         if obj.get('instance',False): # optionally add instance for driver itself, e.g. OneWire bus
                             self.instances[name] = name
@@ -133,22 +146,117 @@ class IO:
             scribe(f"handler[{msg['id']}]: {instance}:{interface.name}")
         try:
             #if self.verbose: scribe(f"IO.handle: id->{msg['id']}, instance->{instance}, interface->{interface}")
-            return interface.handler(msg)
+            mark = heap.start()
+            result = interface.handler(msg)
+            heap.lap(self.laps[instance][0], mark)
+            return result
         except Exception as ex:
             scribe(f"ERROR[{type(ex).__name__}]: broker[IO.handle]: {instance}, {interface}")
+            metrics.count('err.io.handle')
             return None
 
+    def handle_batch(self, msgs, trace=False):
+        """Routes a loop pass worth of action msgs; drivers with handle_batch get all of theirs at once"""
+        batches = {}
+        for msg in msgs:
+            instance = self.instances.get(msg['id'])
+            if instance in batches:
+                batches[instance].append(msg)
+            else:
+                batches[instance] = [msg]
+        results = []
+        for instance, batch in batches.items():
+            interface = self.interfaces.get(instance)
+            batched = getattr(interface,'handle_batch',None)
+            if not batched:
+                for msg in batch:
+                    result = self.handle(msg,trace)
+                    if result:
+                        results.append(result)
+                continue
+            if trace:
+                scribe(f"handle_batch[{instance}]: {len(batch)} msgs")
+            try:
+                mark = heap.start()
+                result = batched(batch)
+                heap.lap(self.laps[instance][0], mark)
+                if result:
+                    results.extend(result)
+            except Exception as ex:
+                scribe(f"ERROR[{type(ex).__name__}]: broker[IO.handle_batch]: {instance}, {interface}")
+                metrics.count('err.io.batch')
+        return results
+
     def identity(self, cfg):
         return str(cfg.get('id',cfg.get('name',cfg.get('sn',cfg.get('addr','UNKNOWN')))))
 
     def poll(self,trace=False):
+        # only poll drivers that declare pending work or lack a due method (i.e. legacy drivers)
         results = []
-        for interface in self.interfaces.values():
+        now = millis()
+        for interface, due, lap in self.schedule:
+            if due and not due(now):
+                continue
+            metrics.count('io.polls')
+            mark = heap.start()
             result = interface.poll()
+            heap.lap(lap, mark)
             if result: 
-                results.extend(result)
+                if isinstance(result, list):
+                    results.extend(result)
+                else:
+                    results.append(result)
             if trace:
                 scribe(f"poll[{interface.name}]: {result}")
+        results.extend(self.buses.poll(now,trace))
+        return results
+
+
+# round-robin scheduler to interleave work across drivers sharing a slow bus type...
+# each pass gives every due driver one step (i.e. poll), so one bus converting does not stall
+# the others; passes repeat until no driver is due or the time budget (ms) is spent
+class BusScheduler:
+
+    def __init__(self, budget=20):
+        self.budget = budget    # ms per loop for all interleaved drivers
+        self.drivers = []
+        self.laps = []          # heap section name per driver, i.e. <name>.poll
+        self.first = 0          # rotating start index so no driver always goes first
+
+    def add(self, driver, lap=None):
+        self.drivers.append(driver)
+        self.laps.append(lap or driver.name+'.poll')
+
+    def poll(self, now, trace=False):
+        results = []
+        n = len(self.drivers)
+        if not n:
+            return results
+        start = self.first
+        self.first = (start + 1) % n
+        end = now + self.budget
+        working = True
+        while working and now <= end:
+            metrics.count('io.bus.passes')
+            working = False
+            for i in range(n):
+                k = (start + i) % n
+                driver = self.drivers[k]
+                if not driver.due(now):
+                    continue
+                working = True
+                metrics.count('io.bus.polls')
+                mark = heap.start()
+                result = driver.poll()
+                heap.lap(self.laps[k], mark)
+                if result:
+                    if isinstance(result, list):
+                        results.extend(result)
+                    else:
+                        results.append(result)
+                if trace:
+                    scribe(f"poll[{driver.name}]: {result}")
+                now = millis()
         return results
 
 
@@ -163,21 +271,19 @@ class Glob:
     def __init__(self):
         # shared data
         self.utc = Zulutime()       # universal time object
-        self.errors = Definition()  # Error logging object
+        self.metrics = metrics      # counters, gauges, and histograms, including errors
+        self.heap = heap            # heap usage per loop phase and driver call
         self.cfg = Definition()     # dot object to hold configuration parameters
         self.io = IO()              # management of io endpoints
         self.cron = Cron(self.utc)  # management of cronjobs
-        self.msgs = Queue()         # incoming message queue
-        self.rtn = Queue()          # return message queue
+        self.msgs = Queue('q.msgs') # incoming message queue
+        self.rtn = Queue('q.rtn')   # return message queue
         #self.actions = Queue()      # action message queue
-        self.events = Queue()       # cronjob events
+        self.events = Queue('q.events') # cronjob events
 
     # report error...
     def error(self,e=None):
         if e==None:
-            ex = {} 
-            for k in self.errors.has():
-                ex[k] = self.errors.resolve(k,None)
-            return ex
-        self.errors.add(dict([(e, self.errors.resolve(e,0)+1)]))
+            return {k[4:]: v for k, v in self.metrics.read('err.').items()}
+        self.metrics.count('err.'+e)
             
\ No newline at end of file
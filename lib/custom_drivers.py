@@ -12,8 +12,15 @@ Every driver should be defined as a class with the following structure
 Note: Capitalize driver class name and append "Driver", for example
     definition { "driver": "Unicorn", "name": "unicorn", "debug": True }
     driver => class UnicornDriver
+Drivers may report counters, gauges, and histograms via the shared metrics registry
+The broker only polls a driver when its optional due(now) method returns True,
+    where now is the broker clock in ms; drivers without due are polled every loop
+Drivers may optionally define handle_batch(msgs) to receive all msgs routed to them
+    in one loop pass, returning a list of replies; otherwise handler(msg) is called per msg
 """
 
+from metrics import metrics
+
 class UnicornDriver:
 
     def __init__(self, cfg, verbose=False):
@@ -22,6 +29,7 @@ class UnicornDriver:
         self.name = cfg['name']
         self.instances = []
         self.aliases = {}
+        self.m_msgs = self.name+'.msgs'     # metric names built once, not per call
 
     def createInstance(self, io, aliases):
         # see other drvier.py examples for necessary actions...
@@ -37,6 +45,7 @@ class UnicornDriver:
         return self.instances[len(self.instances) - 1]
 
     def handler(self, msg):
+        metrics.count(self.m_msgs)
         index = self.aliases.get(msg['id'])
         if index==None:
             return {'tag': "err", 'err': f"NO defined Unicorn instance: {msg['id']}"}
@@ -44,6 +53,10 @@ class UnicornDriver:
         # handle message...
         return msg
 
+    def due(self, now):
+        # optional, return True when poll has work (e.g. queued msgs or a deadline passed)
+        return False
+
     def poll(self):
         # must be defined
         pass
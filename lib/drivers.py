@@ -17,7 +17,8 @@ from analogio import AnalogIn, AnalogOut
 import digitalio
 import pwmio
 from simpleq import Queue
-from onewire import OneWireBus
+from metrics import metrics
+from onewire import OneWireBus, Device, millis
 import onewire_temps, onewire_ports, onewire_other
 try:
     import onewire_user
@@ -27,112 +28,773 @@ except:
 from scribe import Scribe
 scribe = Scribe('DRVR').scribe
 
+"""
+`OneWireDriver`
+====================================================
+Implements a OneWire bus and its device instances
+Parameters:
+    pin:        I/O pin board name
+    parasite:   Bus devices are parasite powered; by default detected at startup by READ POWER
+                SUPPLY, and assumed when no device answers; when False, the bus serves other
+                requests while temperature conversions are in flight, else the bus is held
+                until each conversion completes
+    refresh:    Optional background temperature refresh, {period, stale, force}; every period
+                (ms, default 10000) converts and reads all sensors so requests are served from
+                cache unless older than stale (ms, default 3*period), or the request sets fresh
+                and force (default true) allows it; not available on parasite powered buses
+    early:      Poll read slots after CONVERT_T to finish a conversion as soon as sensors report
+                completion, and use learned (observed) conversion times as deadlines when other
+                bus traffic intervenes, default False; the fixed wait remains the upper bound
+Bus instance actions:
+    scan:           (default) search bus and report known and unknown devices; family optional
+    temperatures:   read all sensors; one SKIP ROM conversion, waiting once for the slowest
+                    resolution, or sequential conversions when the bus is parasite powered (as
+                    detected at startup and when sensors come online, see parasite); units optional;
+                    battery gauges convert in the same window and are returned as gauges {name: values}
+    alarms:         converts as temperatures, then an alarm search reads only the sensors outside
+                    their limits; returns alarms {name: temperature} and unknown serial numbers in alarm
+    subscribe:      arrival and departure events for the cached topology; period (ms, default 10000)
+                    between verification rounds, which check one known device per poll by a targeted
+                    search, falling back to a full scan only when an unknown device shows up; events
+                    as {id: bus name, event: 'arrive'|'depart', sn, name} tagged with events (or tag)
+    unsubscribe:    stops events
+    record:         transaction recorder; size (records, 0 stops) starts or restarts it; returns record
+                    {records, total, devices, ops} with per device and per operation (function command)
+                    transactions, resets, bit slots, and estimated wire time (us) at standard (std) and
+                    overdrive (od) speed; log true adds the records, replayable with onewire_transport.replay
+    changes:        conditional search for watched ports whose inputs changed; reads and resets only their
+                    activity latches; returns changes {name: {sn, activity, data}} where activity flags the
+                    changed channels and data is the port state (1 = ON); subscribers also receive these as
+                    change events (event: 'change') each verification round
+    Scan replies are served from the cached topology when valid (cached true, age in ms) and younger
+    than param scan_age (ms, default 10000), or at any age while subscribed, since verification rounds
+    keep it current; full forces a new search
+Parameter fast: temperature reads take only the two temperature bytes and end with a reset rather
+    than the full scratchpad and CRC (16 rather than 72 slots); values failing plausibility checks
+    (no response, out of range, or a jump of more than 10 C from the last verified reading) are read
+    again in full; a sensor without a verified reading is read in full directly; for short, clean
+    buses; metrics fast.reads, fast.suspect, and
+    crc.errors (full reads) show the trade-off; default false
+Parameter record: ring size (records) of a transaction recorder started with the bus, default off
+Parameter chain: the bus carries a string of DS28EA00 sensors; true adds chain mode discovery to each
+    full scan and scan replies list their sns in physical order as chain; 'only' uses chain discovery
+    in place of the rom search (i.e. a bus of only chained DS28EA00), falling back to a search when
+    no device confirms chain mode
+DS2408 instances: param watch (channel mask, int or hex string) sets up conditional search on the
+    activity latches of those channels, so the changes action costs bus time only for active ports
+Counter instances (DS2423): msgs return counters {c12, c13, A, B}, read in one CRC16 checked transaction;
+    changed returns only the counters that differ from the last reply
+Gauge instances (DS2438): msgs return temperature, units, voltage, and current (amps when param rsens,
+    the sense resistor in ohms, is set, else A/D counts); param source 'vdd' (default) or 'vad' selects
+    the voltage input; refresh cycles and bus conversions cover gauges alongside temperature sensors
+Temperature instances: params th and tl (integer C) set alarm limits; a msg with th and/or tl
+    sets new limits (written to the sensor only when changed) and returns them
+Overdrive capable instances (DS2408, DS2413, DS28EA00): param overdrive (default true) runs their
+    transactions at overdrive speed when the bus transport supports it, falling back to standard
+    speed if the device fails to answer
+Consecutive transactions with the same port instance (DS2408, DS2413, DS28EA00) reselect it by RESUME
+    instead of MATCH ROM, saving 64 rom time slots each (metrics resumes and slots.saved)
+Port instances keep a shadow of their output latch, so SET, CLEAR, TOGGLE, and PULSE need only the
+    write; param resync (ms, default 60000, 0 for always) rereads the latch once the shadow is older,
+    and op REG rereads it on demand
+"""
+
 class OneWireDriver:
     """A class to interface a OneWireBus to the QTPy protocol."""
+    INTERLEAVE = True   # broker interleaves polls across all OneWire buses
+    PROBE = 10          # ms between read slot probes of a live conversion
 
     def __init__(self, cfg, verbose=False):
         self.cfg = cfg
         self.verbose = verbose
         self.params = cfg['params']
         self.name = cfg['name']
-        self.q = Queue()
+        self.q = Queue(self.name+'.q')
         self.active = None
-        self.instances = []
+        self.started = 0    # ms when active msg was pulled from queue
+        self.pending = []   # in-flight conversions as [deadline, devices, [(msg, started, device), ...], resets, start, learned], soonest first
+        self.early = self.params.get('early',False) # detect conversion completion via read slots; learn deadlines
+        self.live = None    # pending entry whose CONVERT_T was the last bus command, so read slots report progress
+        self.next_probe = 0 # ms when poll next probes the live conversion's read slots
+        self.parasite = self.params.get('parasite')   # parasite power needs the bus held while converting; None detects
+        self.seq = 0        # parasite group read progress...
+        self.temps = {}
+        self.cache = {}     # device -> (raw temperature, ms timestamp) of last read
+        self.refresh = self.params.get('refresh')   # background conversion cycle settings, checked once power is known
+        self.cycling = False    # refresh cycle in flight
+        self.next_cycle = 0     # ms when next refresh cycle starts
+        self.m_cycle = self.name+'.cycle.ms'
+        self.m_age = self.name+'.age'
+        self.m_hits = self.name+'.cache.hits'
+        self.m_misses = self.name+'.cache.misses'
+        metrics.histogram(self.m_cycle,(50,100,200,500,750,1000,2000,5000))
+        self.m_conv = self.name+'.conv.ms'
+        metrics.histogram(self.m_conv,(50,100,200,300,400,500,600,700,800))
+        self.topology = {}      # cached bus devices, sn -> address forms, from the last full scan and verifications
+        self.topo_valid = False # False until a full scan, or when verification finds an unknown device
+        self.topo_time = 0      # ms of last full scan
+        self.scan_age = self.params.get('scan_age',10000)  # ms a cached topology serves scans without a subscription
+        self.subscription = None    # arrival/departure event subscription, {tag, period}
+        self.next_verify = 0    # ms when next verification round starts
+        self.verifying = []     # sns left to verify in the current round, one per poll
+        self.events = []        # arrival/departure events awaiting return
+        self.chain = self.params.get('chain')   # chain mode discovery: None, True, or 'only'
+        self.chained = []       # cached DS28EA00 addresses in physical chain order
+        self.instances = [] # devices, by alias index; bus (generic) device first
+        self.names = []     # instance names (or None), parallel to instances
         self.aliases = {}
+        self.unconfigured = []  # sensors and gauges awaiting a batched configuration pass
+        self.unwatched = []     # (port, channel mask) awaiting change detection setup by the first poll
+        self.watched = []       # ports set up for change detection by conditional search
+        self.m_ops = self.name+'.ops'       # metric names built once
+        self.m_ms = self.name+'.op.ms'
+        self.m_err = 'err.'+self.name
+        self.m_resumes = self.name+'.resumes'       # selects by RESUME rather than MATCH ROM
+        self.m_saved = self.name+'.slots.saved'     # rom time slots those selects avoided, 64 each
+        self.m_fast = self.name+'.fast.reads'       # partial (temperature bytes only) scratchpad reads
+        self.m_suspect = self.name+'.fast.suspect'  # partial reads failing plausibility, repeated in full
+        self.m_crc = self.name+'.crc.errors'        # full scratchpad reads failing CRC
+        self.m_od = self.name+'.od.fallbacks'       # devices returned to standard speed after failed overdrive
+        metrics.histogram(self.m_ms,(1,2,5,10,20,50,100,200,500,1000,2000))
         if not 'pin' in self.params:
             raise 'OneWireDriver definition requires a pin parameter!'
         self.bus = OneWireBus(getattr(board,self.params['pin']))
+        if self.params.get('record'):
+            self.bus.record(self.params['record'])
+        self.bus.fast = bool(self.params.get('fast'))
         failed = self.bus.status(cfg.get('debug'))
         if failed:
             raise Exception("ERROR: OneWireDriver[{self.name}]: OneWire bus failure")
         else:
+            if self.parasite==None:
+                self.parasite = self.power()
+            if self.refresh:
+                if self.parasite:
+                    scribe(f"WARN: OneWireDriver[{self.name}]: refresh not supported on parasite powered bus")
+                    self.refresh = None
+                else:
+                    self.refresh = {'period': self.refresh.get('period',10000), 'force': self.refresh.get('force',True),
+                        'stale': self.refresh.get('stale',3*self.refresh.get('period',10000))}
             device = self.bus.define_device(None,{})    # default OneWire Device (bus)
-            self.instances.append({ 'cfg': {}, 'address': None, 'device': device }) # add bus as intial instance
+            self.instances.append(device)   # add bus as intial instance
+            self.names.append(None)
             if self.cfg.get('debug'):
                 try:
                     found = self.bus.scan()
                     scribe(f"Bus scan found {len(found)} devices.")
                     if found:
                         for f in found:
-                            if f['family'] in OneWireBus.REGISTERED:
-                                scribe(f"Found[{f['sn']}]: {OneWireBus.REGISTERED[f['family']].DESC}")
+                            if f.family in OneWireBus.REGISTERED:
+                                scribe(f"Found[{f.sn}]: {OneWireBus.REGISTERED[f.family].DESC}")
                             else:
-                                scribe(f"Found[{f['sn']}]: unknown type")
+                                scribe(f"Found[{f.sn}]: unknown type")
                 except Exception as ex:
                     scribe(f"ERROR[OneWireDriver.init]: {type(ex).__name__} { ex.args}")
                     raise ex
 
+    def power(self):
+        """Detects the bus power mode by READ POWER SUPPLY; True (hold the bus) unless sensors report external power"""
+        try:
+            parasite = onewire_temps.TemperatureSensor.parasite_powered(self.bus)
+        except Exception as ex:
+            scribe(f"ERROR[OneWireDriver.power]: {type(ex).__name__} { ex.args}")
+            parasite = True
+        scribe(f"OneWireDriver[{self.name}] power: {('external','parasite')[parasite]}")
+        return parasite
+
+    def repower(self):
+        """Redetects the power mode, unless set by the parasite param, so bus wide SKIP ROM conversions
+           never reach parasite powered sensors that came online after startup"""
+        if self.params.get('parasite')!=None:
+            return
+        self.parasite = self.power()
+        if self.parasite and self.refresh:
+            scribe(f"WARN: OneWireDriver[{self.name}]: refresh not supported on parasite powered bus")
+            self.refresh = None
+
     def createInstance(self, io, aliases):
         if not 'sn' in io:
             raise 'OneWireDriver instance requires a serial number (sn) parameter!'
-        address = OneWireBus.frmt_addr(OneWireBus.bytes4addr(io['sn']))
-        device = self.bus.define_device(address['rom'], io.get('params',{}))
-        instance = { 'cfg': io, 'address': address, 'device': device }
-        #if self.verbose: scribe(f"OneWireDriver instance: {instance}")
-        self.instances.append(instance)
+        address = self.bus.address(io['sn'])  # interned; shared with scans and the device
+        device = self.bus.define_device(address, io.get('params',{}))
+        #if self.verbose: scribe(f"OneWireDriver instance: {device}")
+        self.instances.append(device)   # device holds the interned address; no per instance wrapper
+        self.names.append(io.get('name'))
+        if isinstance(device, (onewire_temps.TemperatureSensor, onewire_other.DS2438)):
+            self.unconfigured.append(device)    # configured together by the first poll
+        watch = io.get('params',{}).get('watch')
+        if watch!=None and hasattr(device, 'conditional'):
+            self.unwatched.append((device, int(watch,16) if isinstance(watch,str) else watch))
         index = len(self.instances) - 1
         alist = []
         for a in aliases:
             exists = self.aliases.get(a)
             if exists:
-                scribe(f"WARN: OneWire instance '{address['sn']}' alias '{a}' exists; redefining alias")
+                scribe(f"WARN: OneWire instance '{address.sn}' alias '{a}' exists; redefining alias")
             self.aliases[a] = index
-            if a!=address['sn']:
+            if a!=address.sn:
                 alist.append(a)
-        scribe(f"Created OneWire instance[{address['sn']}]: {', '.join(alist)}")
+        scribe(f"Created OneWire instance[{address.sn}]: {', '.join(alist)}")
         return self.instances[index]
 
     def handler(self, msg):
         self.q.push(msg)
         #if self.verbose: scribe(f'handler[{self.name},{self.q.available}]: {msg}')
 
+    def handle_batch(self, msgs):
+        """Queues a loop pass of msgs in arrival order, never reordered; a repeat of a read queued earlier
+           in the pass (the same msg but for its tag) is not queued, the first answers for both. Any other
+           msg ends merging, so a read after a write still sees the write"""
+        reads = []  # (msg less tag, msg) of reads queued since the last non-read
+        for msg in msgs:
+            if not self.mergeable(msg):
+                reads = []
+                self.q.push(msg)
+                continue
+            key = {k: v for k, v in msg.items() if k!='tag'}
+            for k, first in reads:
+                if k==key:
+                    first.setdefault('_dups',[]).append(msg)
+                    break
+            else:
+                reads.append((key, msg))
+                self.q.push(msg)
+
+    def mergeable(self, msg):
+        """True for msgs that only read, so repeats within a pass can share one reply"""
+        device = self.instances[self.aliases.get(msg.get('id'),0)]
+        category = msg.get('CATEGORY',device.CATEGORY)
+        if category=='temperature':
+            return not ('th' in msg or 'tl' in msg)
+        if category=='port':
+            return not ('value' in msg or 'channel' in msg)
+        if category=='counter':
+            return not msg.get('changed')   # changed replies depend on the previous reply
+        if category=='gauge':
+            return True
+        return category=='bus' and msg.get('action') in ('temperatures','alarms')
+
+    def replies(self, reply):
+        """Reply list for a msg and any repeats merged into it by handle_batch, each with its own tag"""
+        dups = reply.pop('_dups',None)
+        if not dups:
+            return [reply]
+        replies = [reply]
+        for d in dups:
+            r = type(d)(d)
+            for k, v in reply.items():
+                if k!='tag':
+                    r[k] = v
+            replies.append(r)
+        return replies
+
+    def due(self, now):
+        """Reports whether poll has work: queued msgs, a passed conversion deadline or live probe time,
+           or an unblocked active msg; checks time and state only, never the bus"""
+        if self.unconfigured:
+            return True
+        if self.pending and now >= self.pending[0][0]:
+            return True
+        if self.live and now >= self.next_probe:
+            return True
+        if self.refresh and not self.cycling and now >= self.next_cycle:
+            return True
+        if self.subscription and (self.verifying or now >= self.next_verify):
+            return True
+        if self.active:
+            return not self.bus.busy or now > self.bus.timex
+        return self.q.available > 0
+
+    def sensors(self):
+        """Lists (name, device) for every temperature sensor instance on the bus"""
+        return [(self.names[k] or d.sn, d) for k, d in enumerate(self.instances)
+            if isinstance(d, onewire_temps.TemperatureSensor)]
+
+    def gauges(self):
+        """Lists (name, device) for every battery gauge (DS2438) instance on the bus"""
+        return [(self.names[k] or d.sn, d) for k, d in enumerate(self.instances)
+            if isinstance(d, onewire_other.DS2438)]
+
+    def values(self, device, raw, units):
+        """Reply fields for a device's raw reading"""
+        if isinstance(device, onewire_other.DS2438):
+            return device.values(raw, units)
+        return {'temperature': device.temp_as(raw, units), 'units': units}
+
+    def convert(self, device, msg, started):
+        """Starts a conversion (device==None for all sensors and gauges) or joins one in flight, without holding the bus"""
+        for p in self.pending:
+            if (device==None and p[2][0][2]==None) or device in p[1]:    # bus wide entries start with a device None msg
+                p[2].append((msg, started, device))
+                return
+        gauges = []
+        if device==None:    # one window: CONVERT_T reaches sensors and gauges, then CONVERT_V for gauges
+            devices = [d for n, d in self.sensors()]
+            gauges = [d for n, d in self.gauges()]
+            wait = onewire_temps.TemperatureSensor.convert_all(self.bus, devices + gauges)
+            wait = max(wait, onewire_other.DS2438.convert_all(self.bus, gauges))
+            devices += gauges
+        else:
+            devices = [device]
+            wait = device.convert()
+        if self.live:
+            self.drop_live()    # this conversion's commands end the read slot reports of the last
+        now = millis()
+        live = self.early and not gauges and not isinstance(device, onewire_other.DS2438)
+        learned = now + max([d.deadline() for d in devices]) if self.early and wait and devices else now + wait
+        # while live, only the probe or the fixed wait completes a conversion; a learned deadline could read mid conversion
+        entry = [now + wait if live else learned, devices, [(msg, started, device)], self.bus.resets, now, learned]
+        self.schedule(entry)
+        if live:
+            self.live = entry   # read slots report CONVERT_T progress only when it was the last command
+            self.next_probe = now + OneWireDriver.PROBE
+
+    def schedule(self, entry):
+        """Inserts a pending conversion entry in deadline order"""
+        i = 0
+        while i < len(self.pending) and self.pending[i][0] <= entry[0]:
+            i += 1
+        self.pending.insert(i, entry)
+
+    def drop_live(self):
+        """Ends read slot probing of the live conversion after other bus traffic; it falls back to its learned deadline"""
+        entry = self.live
+        self.live = None
+        if entry[5] < entry[0]:
+            for i, p in enumerate(self.pending):
+                if p is entry:
+                    entry[0] = entry[5]
+                    self.schedule(self.pending.pop(i))
+                    break
+
+    def finish(self, entry):
+        """Makes a conversion reported complete via read slots due now and records its observed time"""
+        now = millis()
+        ms = now - entry[4]
+        for d in entry[1]:
+            d.observe(ms)
+        metrics.observe(self.m_conv,ms)
+        self.live = None
+        entry[0] = now
+        for i, p in enumerate(self.pending):
+            if p is entry:
+                self.pending.insert(0, self.pending.pop(i))
+                break
+
+    def deliver(self, entry):
+        """Reads each device of a completed conversion once and replies to every msg waiting on it"""
+        if entry is self.live:
+            self.live = None
+        alarmed = None
+        if [1 for m, s, d in entry[2] if m!=None and m.get('action')=='alarms']:
+            alarmed = self.alarmed()    # search before reads; only sensors in alarm are read for alarms msgs
+        need = []   # devices to read, each once
+        for msg, started, device in entry[2]:
+            if device!=None:
+                need.append(device)
+            elif msg!=None and msg.get('action')=='alarms':
+                need.extend([d for n, d in alarmed[0]])
+            else:
+                need = entry[1]
+                break
+        raws = {}
+        now = millis()
+        for device in entry[1]:
+            if device in need and not device in raws:
+                raws[device] = device.read_raw()
+                self.cache[device] = (raws[device], now)
+        names = None
+        replies = []
+        for msg, started, device in entry[2]:
+            if msg==None:   # background refresh cycle
+                self.cycling = False
+                metrics.observe(self.m_cycle,now-started)
+                continue
+            reply = type(msg)(msg)
+            if device==None:    # group read
+                if names==None:
+                    names = self.sensors()
+                units = msg.get('units')
+                if msg.get('action')=='alarms':
+                    temps = {n: d.temp_as(raws[d], units or d.units) for n, d in alarmed[0]}
+                    reply.update({'alarms': temps, 'unknown': alarmed[1], 'units': units})
+                else:
+                    temps = {}
+                    for n, d in names:
+                        if d in raws:
+                            temps[n] = d.temp_as(raws[d], units or d.units)
+                    reply.update({'temperatures': temps, 'units': units})
+                    gauges = {n: d.values(raws[d], units) for n, d in self.gauges() if d in raws}
+                    if gauges:
+                        reply['gauges'] = gauges
+            else:
+                reply.update(self.values(device, raws[device], msg.get('units',device.units)))
+            metrics.count(self.m_ops)
+            metrics.observe(self.m_ms,millis()-started)
+            replies.extend(self.replies(reply))
+        self.bus_metrics()
+        return replies
+
+    def bus_metrics(self):
+        """Mirrors the bus counters into metrics"""
+        metrics.gauge(self.m_resumes,self.bus.resumes)
+        metrics.gauge(self.m_saved,self.bus.resumes<<6)
+        metrics.gauge(self.m_fast,self.bus.fast_reads)
+        metrics.gauge(self.m_suspect,self.bus.fast_suspect)
+        metrics.gauge(self.m_crc,self.bus.crc_errors)
+        metrics.gauge(self.m_od,self.bus.od_fallbacks)
+
+    def alarmed(self):
+        """Alarm search: (name, device) of sensor instances in alarm, and serial numbers of unknown devices in alarm"""
+        found = self.bus.scan(None, True)
+        sensors = {d.sn: (n, d) for n, d in self.sensors()}
+        known = []
+        unknown = []
+        for f in found:
+            if f.sn in sensors:
+                known.append(sensors[f.sn])
+            elif not [1 for d in self.instances if d.addr is f]:
+                unknown.append(f.sn)
+        return known, unknown
+
+    def changes(self):
+        """Conditional search for watched ports with input activity; reads and resets only their latches"""
+        if not self.watched:
+            return {}
+        found = self.bus.scan(onewire_ports.DS2408.FAMILY, True)
+        changes = {}
+        for d in self.watched:
+            if d.addr in found:
+                r = d.activity()
+                if r==None:
+                    metrics.count(self.m_err)
+                    continue
+                name = self.names[self.instances.index(d)] or d.addr.sn
+                changes[name] = {'sn': d.addr.sn, 'activity': r[1] & d.mask, 'data': d.mask & ~r[0]}
+        return changes
+
+    def cycle(self):
+        """Starts a background refresh cycle: convert all now, read all when done"""
+        now = millis()
+        self.cycling = True
+        self.next_cycle = now + self.refresh['period']
+        self.convert(None, None, now)
+
+    def cached(self, device, msg):
+        """Latest refreshed reading for device, unless stale or the msg forces a fresh conversion"""
+        entry = self.cache.get(device)
+        if entry==None or (msg.get('fresh') and self.refresh['force']):
+            metrics.count(self.m_misses)
+            return None
+        age = millis() - entry[1]
+        if age > self.refresh['stale']:
+            metrics.count(self.m_misses)
+            return None
+        metrics.count(self.m_hits)
+        metrics.gauge(self.m_age,age)
+        reply = self.values(device, entry[0], msg.get('units',device.units))
+        reply['age'] = age
+        return reply
+
+    def sequence(self, units=None, read=True):
+        """Reads (or only converts) all sensors one conversion at a time, holding the bus, for parasite powered buses"""
+        names = self.sensors()
+        while self.seq < len(names):
+            n, d = names[self.seq]
+            if read:
+                t = d.temperature(units)
+                if t==None:
+                    return None # converting; poll again when the hold expires
+                self.temps[n] = t
+            elif not self.bus.busy:
+                self.bus.hold(d.convert())
+                return None
+            elif not self.bus.ready:
+                return None
+            self.seq += 1
+        return self.temps
+
+    def rescan(self):
+        """Full search; replaces the cached topology and queues events for any changes"""
+        chained = self.bus.chain() if self.chain else None
+        if chained!=None:
+            self.chained = chained
+        found = chained if chained!=None and self.chain=='only' else self.bus.scan()
+        topology = {f.sn: f for f in found}
+        if self.topo_time:  # first scan sets the baseline silently
+            arrived = False
+            for sn in topology:
+                if not sn in self.topology:
+                    self.event('arrive', sn)
+                    arrived = True
+            for sn in self.topology:
+                if not sn in topology:
+                    self.event('depart', sn)
+            if arrived:
+                self.repower()  # an arriving sensor may be parasite powered
+        self.topology = topology
+        self.topo_valid = True
+        self.topo_time = millis()
+
+    def event(self, kind, sn, info=None):
+        if not self.subscription:
+            return
+        names = [self.names[k] for k, d in enumerate(self.instances) if d.addr and d.addr.sn==sn]
+        evt = {'id': self.name, 'event': kind, 'sn': sn, 'name': names[0] if names else None}
+        if info:
+            evt.update(info)
+        if self.subscription['tag']:
+            evt['tag'] = self.subscription['tag']
+        self.events.append(evt)
+
+    def watch(self):
+        """Incremental topology refresh for subscribers: verifies one cached rom per poll by targeted
+           search, and falls back to a full scan only when the cache is invalid"""
+        if not self.verifying:
+            self.next_verify = millis() + self.subscription['period']
+            for name, change in self.changes().items():
+                self.event('change', change['sn'], {'activity': change['activity'], 'data': change['data']})
+            if not self.topo_valid:
+                self.rescan()
+                return
+            self.verifying = list(self.topology.keys())
+            if not self.verifying:  # empty bus; only a full scan can see arrivals
+                self.topo_valid = False
+                return
+        sn = self.verifying.pop(0)
+        rom = self.topology[sn].rom
+        present, unknown = self.bus.verify(rom, [a.rom for k, a in self.topology.items() if k!=sn])
+        if not present:
+            del self.topology[sn]
+            self.chained = [a for a in self.chained if a.sn!=sn]
+            self.event('depart', sn)
+        if unknown:
+            self.topo_valid = False
+            self.verifying = []
+
     def poll(self):
         def packet(data):
             tmp = (type(self.active)(self.active))
             self.active = None
             tmp.update(data)
+            self.seq = 0
+            self.temps = {}
+            metrics.count(self.m_ops)
+            metrics.observe(self.m_ms,millis()-self.started)
+            self.bus_metrics()
+            if '_dups' in tmp:
+                return self.replies(tmp)
             return tmp
+        # configure new sensors, then gauges, a pass each skipping those already set, and set up watched ports...
+        if self.unconfigured or self.unwatched:
+            sensors = self.unconfigured
+            ports = self.unwatched
+            self.unconfigured = []
+            self.unwatched = []
+            try:
+                for d, mask in ports:
+                    if d.conditional(mask) and d.activity()!=None:
+                        self.watched.append(d)  # latches reset so only later changes report
+                    else:
+                        scribe(f"WARN: OneWireDriver[{self.name}]: watch setup failed for {d.addr.sn}")
+                        metrics.count(self.m_err)
+                gauges = [d for d in sensors if isinstance(d, onewire_other.DS2438)]
+                sensors = [d for d in sensors if not d in gauges]
+                if sensors:
+                    self.repower()  # sensors defined after startup detection, possibly absent then
+                rpt = Device.configure_all(sensors)
+                for k, v in rpt.items():
+                    metrics.count(self.name+'.cfg.'+k,v)
+                scribe(f"OneWireDriver[{self.name}] sensor setup: {rpt}")
+                if gauges:
+                    rpt = Device.configure_all(gauges)
+                    for k, v in rpt.items():
+                        metrics.count(self.name+'.gauge.cfg.'+k,v)
+                    scribe(f"OneWireDriver[{self.name}] gauge setup: {rpt}")
+            except Exception as ex:
+                scribe(f"Error[OneWireDriver.poll: {ex}")
+                metrics.count(self.m_err)
+            return None
+        # probe a live conversion's read slots; a finished one becomes due for delivery...
+        if self.live and millis() >= self.next_probe:
+            try:
+                if self.live[3]!=self.bus.resets:   # other bus traffic since; fall back to learned deadline
+                    self.drop_live()
+                elif self.bus.readbit():
+                    self.finish(self.live)
+                else:
+                    self.next_probe = millis() + OneWireDriver.PROBE
+            except Exception as ex:
+                scribe(f"Error[OneWireDriver.poll: {ex}")
+                metrics.count(self.m_err)
+                if self.live:
+                    self.drop_live()
+            if not self.due(millis()):
+                return None
+        # deliver completed conversions first...
+        if self.pending and millis() >= self.pending[0][0]:
+            try:
+                return self.deliver(self.pending.pop(0))
+            except Exception as ex:
+                scribe(f"Error[OneWireDriver.poll: {ex}")
+                metrics.count(self.m_err)
+                return None
+        if self.refresh and not self.cycling and millis() >= self.next_cycle:
+            try:
+                self.cycle()
+            except Exception as ex:
+                scribe(f"Error[OneWireDriver.poll: {ex}")
+                metrics.count(self.m_err)
+                self.cycling = False
+            return None
+        if self.subscription and (self.verifying or millis() >= self.next_verify):
+            try:
+                self.watch()
+            except Exception as ex:
+                scribe(f"Error[OneWireDriver.poll: {ex}")
+                metrics.count(self.m_err)
+                self.verifying = []
+            events = self.events
+            self.events = []
+            return events
         # process pending actions...
         if not self.active and self.q.available:
             self.active = self.q.pull()
+            self.started = millis()
         if self.active:
             try:
                 ref = self.aliases.get(self.active['id'],0)
-                instance = self.instances[ref]
-                category = self.active.get('CATEGORY',instance['device'].CATEGORY)
+                device = self.instances[ref]
+                category = self.active.get('CATEGORY',device.CATEGORY)
+                if category=='temperature' and ('th' in self.active or 'tl' in self.active):
+                    th, tl = device.limits(self.active.get('th'), self.active.get('tl'))
+                    return packet({'th': th, 'tl': tl})
+                if category=='temperature' and self.refresh:
+                    hit = self.cached(device, self.active)
+                    if hit: return packet(hit)
+                if category=='temperature' and not self.parasite:
+                    self.convert(device, self.active, self.started)
+                    self.active = None  # bus free while converting; serve other requests
+                    return None
                 if category=='temperature':
-                    units = self.active.get('units',instance['device'].units)
-                    temp = instance['device'].temperature(units)
+                    units = self.active.get('units',device.units)
+                    temp = device.temperature(units)
                     if temp==None: return None
                     return packet({'temperature':temp, 'units': units})
                 elif category=='port':
-                    return packet(instance['device'].action(self.active))
+                    return packet(device.action(self.active))
+                elif category=='counter':
+                    return packet(device.action(self.active))
+                elif category=='gauge':
+                    if self.refresh:
+                        hit = self.cached(device, self.active)
+                        if hit: return packet(hit)
+                    self.convert(device, self.active, self.started)  # gauges need VDD, so never hold the bus
+                    self.active = None
+                    return None
+                elif category=='bus' and self.active.get('action') in ('temperatures','convert'):
+                    if self.refresh:
+                        units = self.active.get('units')
+                        temps = {}
+                        for n, d in self.sensors():
+                            hit = self.cached(d, self.active)
+                            if not hit: break
+                            temps[n] = d.temp_as(self.cache[d][0], units or d.units)
+                        else:
+                            gauges = {}
+                            for n, d in self.gauges():
+                                hit = self.cached(d, self.active)
+                                if not hit: break
+                                gauges[n] = d.values(self.cache[d][0], units)
+                            else:
+                                reply = {'temperatures': temps, 'units': units}
+                                if gauges:
+                                    reply['gauges'] = gauges
+                                return packet(reply)
+                    if not self.parasite:   # one SKIP ROM conversion for all sensors
+                        self.convert(None, self.active, self.started)
+                        self.active = None
+                        return None
+                    units = self.active.get('units')
+                    temps = self.sequence(units)
+                    if temps==None: return None
+                    return packet({'temperatures': temps, 'units': units})
+                elif category=='bus' and self.active.get('action')=='alarms':
+                    if self.refresh:    # refresh conversions leave alarm flags current
+                        units = self.active.get('units')
+                        if not [1 for n, d in self.sensors() if not self.cached(d, self.active)]:
+                            known, unknown = self.alarmed()
+                            temps = {n: d.temp_as(self.cache[d][0], units or d.units) for n, d in known}
+                            return packet({'alarms': temps, 'unknown': unknown, 'units': units})
+                    if not self.parasite:   # one SKIP ROM conversion, then alarm search when done
+                        self.convert(None, self.active, self.started)
+                        self.active = None
+                        return None
+                    if self.sequence(None, False)==None: return None
+                    units = self.active.get('units')
+                    known, unknown = self.alarmed()
+                    temps = {n: d.read(units) for n, d in known}
+                    return packet({'alarms': temps, 'unknown': unknown, 'units': units})
+                elif category=='bus' and self.active.get('action')=='record':
+                    if 'size' in self.active:
+                        self.bus.record(self.active['size'])
+                    if not self.bus.recorder:
+                        return packet({'record': None})
+                    reply = {'record': self.bus.recorder.stats()}
+                    if self.active.get('log'):
+                        reply['log'] = self.bus.recorder.dump()
+                    return packet(reply)
+                elif category=='bus' and self.active.get('action')=='changes':
+                    return packet({'changes': self.changes()})
+                elif category=='bus' and self.active.get('action') in ('subscribe','unsubscribe'):
+                    period = self.active.get('period',10000)
+                    if self.active['action']=='unsubscribe' or not period:
+                        self.subscription = None
+                        self.verifying = []
+                    else:
+                        self.subscription = {'tag': self.active.get('events',self.active.get('tag')), 'period': period}
+                        self.next_verify = millis()
+                    return packet({'subscription': self.subscription})
                 elif category=='bus':
                     family = self.active.get('family')
-                    status = instance['device'].bus.status(self.active.get('dump'))
-                    scan = None if status else instance['device'].search(family)
+                    if isinstance(family,str):
+                        family = int(family,16)
+                    status = False
+                    cached = self.topo_valid and not self.active.get('full') and (self.subscription
+                        or millis() - self.topo_time < self.scan_age)  # subscribers keep it verified
+                    if not cached:  # full search when the cache is invalid, expired, or on request
+                        status = device.bus.status(self.active.get('dump'))
+                        if not status:
+                            self.rescan()
+                    scan = None if status else [x.asdict() for x in self.topology.values()
+                        if family==None or x.family==family]
                     existing = {}
                     known = {}
                     unknown = []
-                    for i in self.instances:
-                        sn = None if not i['address'] else i['address']['sn']
-                        if sn:
-                            name = i['cfg'].get('name',"unnamed")
-                            existing[sn] = name
+                    for k, d in enumerate(self.instances):
+                        if d.addr:
+                            existing[d.addr.sn] = self.names[k] or "unnamed"
                     if scan:
                         for x in scan:
-                            x['rom'] = str(x['rom'])
-                            #if self.verbose: scribe(f"bus scan found: {x['sn']}")
                             k = existing.get(x['sn'],None)
                             if k:
                                 known[x['sn']] = k
                             else:
                                 unknown += [x['sn']]
-                    return packet({'status': status, 'scan': scan, 'known': known, 'unknown': unknown })
+                    events = self.events
+                    self.events = []
+                    reply = {'status': status, 'scan': scan, 'known': known, 'unknown': unknown,
+                        'cached': cached, 'age': millis()-self.topo_time }
+                    if self.chain:
+                        reply['chain'] = [a.sn for a in self.chained]
+                    reply = packet(reply)
+                    return [reply] + events if events else reply
+                else:   # release the active slot so the bus scheduler does not spin on it
+                    return packet({'err': f"Unsupported category: {category}"})
             except Exception as ex:
                 scribe(f"Error[OneWireDriver.poll: {ex}")
-                packet(ex)
-                return None
+                metrics.count(self.m_err)
+                return packet({'err': f"{type(ex).__name__}: {ex}"})
 
 class AnalogDriver:
 
@@ -142,6 +804,28 @@ class AnalogDriver:
         self.name = cfg['name']
         self.instances = []
         self.aliases = {}
+        self.m_msgs = self.name+'.msgs'     # metric names built once
+        self.m_err = 'err.'+self.name
+
+    def power(self):
+        """Detects the bus power mode by READ POWER SUPPLY; True (hold the bus) unless sensors report external power"""
+        try:
+            parasite = onewire_temps.TemperatureSensor.parasite_powered(self.bus)
+        except Exception as ex:
+            scribe(f"ERROR[OneWireDriver.power]: {type(ex).__name__} { ex.args}")
+            parasite = True
+        scribe(f"OneWireDriver[{self.name}] power: {('external','parasite')[parasite]}")
+        return parasite
+
+    def repower(self):
+        """Redetects the power mode, unless set by the parasite param, so bus wide SKIP ROM conversions
+           never reach parasite powered sensors that came online after startup"""
+        if self.params.get('parasite')!=None:
+            return
+        self.parasite = self.power()
+        if self.parasite and self.refresh:
+            scribe(f"WARN: OneWireDriver[{self.name}]: refresh not supported on parasite powered bus")
+            self.refresh = None
 
     def createInstance(self, io, aliases):
         params = io.get('params',{})
@@ -176,8 +860,10 @@ class AnalogDriver:
         return self.instances[len(self.instances) - 1]
 
     def handler(self, msg):
+        metrics.count(self.m_msgs)
         index = self.aliases.get(msg['id'])
         if index==None:
+            metrics.count(self.m_err)
             return {'tag': "err", 'err': f"NO defined Analog instance: {msg['id']}"}
         instance = self.instances[index]
         if 'out' in msg:
@@ -188,6 +874,9 @@ class AnalogDriver:
             msg[k] = v
         return msg
 
+    def due(self, now):
+        return False    # handler does all the work
+
     def poll(self):
         pass
 
@@ -229,8 +918,30 @@ class DigitalDriver:
         self.name = cfg['name']
         self.instances = []
         self.aliases = {}
+        self.m_msgs = self.name+'.msgs'     # metric names built once
+        self.m_err = 'err.'+self.name
         self.watches = []
 
+    def power(self):
+        """Detects the bus power mode by READ POWER SUPPLY; True (hold the bus) unless sensors report external power"""
+        try:
+            parasite = onewire_temps.TemperatureSensor.parasite_powered(self.bus)
+        except Exception as ex:
+            scribe(f"ERROR[OneWireDriver.power]: {type(ex).__name__} { ex.args}")
+            parasite = True
+        scribe(f"OneWireDriver[{self.name}] power: {('external','parasite')[parasite]}")
+        return parasite
+
+    def repower(self):
+        """Redetects the power mode, unless set by the parasite param, so bus wide SKIP ROM conversions
+           never reach parasite powered sensors that came online after startup"""
+        if self.params.get('parasite')!=None:
+            return
+        self.parasite = self.power()
+        if self.parasite and self.refresh:
+            scribe(f"WARN: OneWireDriver[{self.name}]: refresh not supported on parasite powered bus")
+            self.refresh = None
+
     def createInstance(self, io, aliases):
         params = io.get('params',{})
         if not 'pin' in params:
@@ -274,8 +985,10 @@ class DigitalDriver:
         return self.instances[len(self.instances) - 1]
 
     def handler(self, msg):
+        metrics.count(self.m_msgs)
         index = self.aliases.get(msg['id'])
         if index==None:
+            metrics.count(self.m_err)
             return {'tag': "err", 'err': f"NO defined Digital instance: {msg['id']}"}
         instance = self.instances[index]
         if 'out' in msg:
@@ -287,6 +1000,9 @@ class DigitalDriver:
         msg['value'] = instance['io'].value
         return msg
 
+    def due(self, now):
+        return len(self.watches) > 0
+
     def poll(self):
         msgs = []
         for w in self.watches[:]:
@@ -335,6 +1051,28 @@ class PWMDriver:
         self.name = cfg['name']
         self.instances = []
         self.aliases = {}
+        self.m_msgs = self.name+'.msgs'     # metric names built once
+        self.m_err = 'err.'+self.name
+
+    def power(self):
+        """Detects the bus power mode by READ POWER SUPPLY; True (hold the bus) unless sensors report external power"""
+        try:
+            parasite = onewire_temps.TemperatureSensor.parasite_powered(self.bus)
+        except Exception as ex:
+            scribe(f"ERROR[OneWireDriver.power]: {type(ex).__name__} { ex.args}")
+            parasite = True
+        scribe(f"OneWireDriver[{self.name}] power: {('external','parasite')[parasite]}")
+        return parasite
+
+    def repower(self):
+        """Redetects the power mode, unless set by the parasite param, so bus wide SKIP ROM conversions
+           never reach parasite powered sensors that came online after startup"""
+        if self.params.get('parasite')!=None:
+            return
+        self.parasite = self.power()
+        if self.parasite and self.refresh:
+            scribe(f"WARN: OneWireDriver[{self.name}]: refresh not supported on parasite powered bus")
+            self.refresh = None
 
     def createInstance(self, io, aliases):
         
@@ -365,8 +1103,10 @@ class PWMDriver:
         return self.instances[len(self.instances) - 1]
 
     def handler(self, msg):
+        metrics.count(self.m_msgs)
         index = self.aliases.get(msg['id'])
         if index==None:
+            metrics.count(self.m_err)
             return {'tag': "err", 'err': f"NO defined PWM instance: {msg['id']}"}
         instance = self.instances[index]
         if 'dc' in msg:
@@ -376,6 +1116,9 @@ class PWMDriver:
         
         return msg
 
+    def due(self, now):
+        return False    # handler does all the work
+
     def poll(self):
         pass
 
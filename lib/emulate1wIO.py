@@ -4,6 +4,12 @@
 `emulate1wIO`
 ====================================================
 Emulates the low level OneWire IO routines for testing search algorithm, etc.
+Each emulated device runs as a generator clocked one time slot at a time on a
+wired-AND bus, so device models respond to real command sequences. OneWire
+also implements the onewire_transport interface natively (block calls), so it
+can stand in for the onewireio module or be passed to OneWireBus as a transport.
+Overdrive capable devices model overdrive skip/match entry; the bus accounts time slots and
+emulated bus time (us) per speed.
 
 * Author(s): CanyonCasa
 """
@@ -12,98 +18,484 @@ Emulates the low level OneWire IO routines for testing search algorithm, etc.
 #__repo__ = "https://github.com/CanyonCasa/Custom-Node-Red-Nodes"
 
 # from microcontroller import Pin
+from time import monotonic_ns
 
 def hex2bits(h):
     return bin(int(h,16)).replace('0b','0000000')[-8:]
 
+# nominal time (us) per reset (reset low + presence window) and per time slot (incl. recovery) by speed
+RESET_US = (960, 96)    # standard, overdrive
+SLOT_US = (70, 10)
+
+def millis():
+    return monotonic_ns() // 1000000
+
+def crc8(data) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8C if crc & 1 else crc >> 1
+    return crc
+
+def crc16(data, crc: int=0) -> int:
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0xA001
+            byte >>= 1
+    return crc
+
+def rom4sn(sn: str) -> bytes:
+    sn = sn.replace(' ','').replace('-','')
+    return bytes([int(sn[i:i+2],16) for i in range(0,len(sn),2)])
+
+
+class Device:
+    """Emulated device ROM layer; function commands handled by subclasses. Generators yield the
+       bit driven for each time slot (1 = released) and receive the resulting bus state"""
+    OVERDRIVE = False   # supports overdrive ROM commands
+    RESUME = False      # supports RESUME command
+
+    def __init__(self, sn: str):
+        self.sn = sn.replace(' ','')
+        self.rom = rom4sn(sn)
+        self.present = True
+        self.gen = None
+        self.drive = 1
+        self.rc = False     # resume flag, set when last selected
+        self.od = False     # in overdrive; only a standard speed reset returns to standard
+
+    def rx_byte(self):
+        v = 0
+        for i in range(8):
+            b = yield 1
+            v |= b << i
+        return v
+
+    def tx_byte(self, v: int):
+        for i in range(8):
+            yield (v >> i) & 1
+
+    def tx_bytes(self, data):
+        for v in data:
+            yield from self.tx_byte(v)
+
+    def idle(self):
+        while True:
+            yield 1
+
+    def alarm(self) -> bool:
+        """Condition for alarm/conditional search participation"""
+        return False
+
+    def enabled(self) -> bool:
+        """Condition for conditional read rom (chain mode) participation"""
+        return False
+
+    def run(self):
+        cmd = yield from self.rx_byte()
+        if cmd==0x55:                       # MATCH ROM
+            for i in range(8):
+                b = yield from self.rx_byte()
+                if b!=self.rom[i]:
+                    self.rc = False
+                    yield from self.idle()
+            self.rc = True
+        elif cmd==0x69 and self.OVERDRIVE:  # OVERDRIVE MATCH ROM, rom sent at overdrive speed
+            self.od = True
+            for i in range(8):
+                b = yield from self.rx_byte()
+                if b!=self.rom[i]:
+                    self.od = False     # non-matching devices cannot follow overdrive slots
+                    self.rc = False
+                    yield from self.idle()
+            self.rc = True
+        elif cmd==0xCC:                     # SKIP ROM
+            self.rc = False
+        elif cmd==0x3C and self.OVERDRIVE:  # OVERDRIVE SKIP ROM
+            self.od = True
+            self.rc = False
+        elif cmd==0x33:                     # READ ROM, single device bus only
+            yield from self.tx_bytes(self.rom)
+            self.rc = True
+        elif cmd==0xA5 and self.RESUME:     # RESUME
+            if not self.rc:
+                yield from self.idle()
+        elif cmd==0x0F and self.enabled():  # CONDITIONAL READ ROM, chain mode
+            yield from self.tx_bytes(self.rom)
+            self.rc = True
+        elif cmd in (0xF0, 0xEC):           # SEARCH ROM, ALARM/CONDITIONAL SEARCH
+            if cmd==0xEC and not self.alarm():
+                self.rc = False
+                yield from self.idle()
+            for i in range(64):
+                bit = (self.rom[i>>3] >> (i&7)) & 1
+                yield bit
+                yield 1 - bit
+                b = yield 1
+                if b!=bit:
+                    self.rc = False
+                    yield from self.idle()
+            self.rc = True
+            yield from self.idle()
+        else:
+            self.rc = False
+            yield from self.idle()
+        yield from self.function()
+        yield from self.idle()
+
+    def function(self):
+        """Device function command layer, after a device is selected"""
+        yield from self.idle()
+
+
+class DS18B20(Device):
+    """Emulated temperature sensor; temp in C, conversion time in ms @ 12 bits, parasite (or VDD) powered"""
+
+    def __init__(self, sn: str, temp: float=21.5, conversion: int=750, parasite: bool=False):
+        super().__init__(sn)
+        self.temp = temp
+        self.conversion = conversion
+        self.parasite = parasite
+        self.sp = bytearray([0x50, 0x05, 0x4B, 0x46, 0x7F, 0xFF, 0x0C, 0x10])    # power-on scratchpad
+        self.eeprom = bytearray(self.sp[2:5])
+        self.eeprom_writes = 0
+        self.done = 0       # ms when conversion completes
+
+    def convert(self):
+        bits = ((self.sp[4] >> 5) & 3) + 9
+        self.done = millis() + (self.conversion >> (12-bits))
+        raw = int(round(self.temp * 16)) & ~((1 << (12-bits)) - 1) & 0xFFFF
+        self.sp[0] = raw & 0xFF
+        self.sp[1] = raw >> 8
+
+    def alarm(self) -> bool:
+        t = self.sp[1] << 8 | self.sp[0]
+        t = (t - 65536 if t & 0x8000 else t) >> 4
+        th = self.sp[2] - 256 if self.sp[2] & 0x80 else self.sp[2]
+        tl = self.sp[3] - 256 if self.sp[3] & 0x80 else self.sp[3]
+        return t >= th or t <= tl
+
+    def function(self):
+        cmd = yield from self.rx_byte()
+        yield from self.command(cmd)
+        yield from self.idle()
+
+    def command(self, cmd: int):
+        if cmd==0x44:       # CONVERT T; read slots return 0 until done
+            self.convert()
+            while True:
+                yield 1 if millis() >= self.done else 0
+        elif cmd==0xBE:     # READ SCRATCHPAD
+            yield from self.tx_bytes(bytes(self.sp) + bytes([crc8(self.sp)]))
+        elif cmd==0x4E:     # WRITE SCRATCHPAD
+            for i in range(3):
+                self.sp[2+i] = yield from self.rx_byte()
+            self.sp[4] |= 0x1F
+        elif cmd==0x48:     # COPY SCRATCHPAD
+            self.eeprom_writes += 1
+            self.eeprom[:] = self.sp[2:5]
+        elif cmd==0xB8:     # RECALL EEPROM
+            self.sp[2:5] = self.eeprom
+        elif cmd==0xB4:     # READ POWER SUPPLY; parasite powered devices pull read slots low
+            while True:
+                yield 0 if self.parasite else 1
+
+
+class DS28EA00(DS18B20):
+    """Emulated chainable temperature sensor; prev is the upstream device whose PIOA (DONE) drives
+       this device's PIOB (EN), None for the first device of the chain (EN tied low)"""
+    OVERDRIVE = True
+    RESUME = True
+
+    def __init__(self, sn: str, temp: float=21.5, conversion: int=750, prev=None):
+        super().__init__(sn, temp, conversion)
+        self.prev = prev
+        self.chain = False  # in chain mode
+        self.chain_done = False # chain DONE, PIOA low
+
+    def enabled(self) -> bool:
+        return self.chain and not self.chain_done and (self.prev==None or self.prev.chain_done)
+
+    def command(self, cmd: int):
+        if cmd==0x99:       # CHAIN; OFF, ON, or DONE control code and its complement
+            code = yield from self.rx_byte()
+            inv = yield from self.rx_byte()
+            if code ^ inv != 0xFF or not code in (0x3C, 0x5A, 0x96):
+                return
+            if code==0x96:
+                self.chain_done = self.chain
+            else:
+                self.chain = code==0x5A
+                self.chain_done = False
+            while True:
+                yield from self.tx_byte(0xAA)
+        else:
+            yield from super().command(cmd)
+
+
+class DS2408(Device):
+    """Emulated 8-bit port; ext models external drive of the (open drain) pins"""
+    OVERDRIVE = True
+    RESUME = True
+
+    def __init__(self, sn: str):
+        super().__init__(sn)
+        self.regs = bytearray([0xFF, 0xFF, 0x00, 0x00, 0x00, 0x88, 0xFF, 0xFF])  # registers 0x88-0x8F; VCC powered (VCCP)
+        self.ext = 0xFF
+
+    def update(self):
+        pins = self.regs[1] & self.ext
+        self.regs[2] |= pins ^ self.regs[0]     # activity latches
+        self.regs[0] = pins
+
+    def inputs(self, ext: int):
+        self.ext = ext
+        self.update()
+
+    def alarm(self) -> bool:
+        self.update()
+        mask, polarity, ctrl = self.regs[3], self.regs[4], self.regs[5]
+        src = self.regs[2] if ctrl & 1 else self.regs[0]
+        match = ~(src ^ polarity) & mask
+        if ctrl & 2:    # AND of selected channels
+            return mask!=0 and match==mask
+        return match!=0
+
+    def function(self):
+        cmd = yield from self.rx_byte()
+        self.update()
+        if cmd==0xF0:       # READ PIO REGISTERS, to end of registers then inverted CRC16
+            ta1 = yield from self.rx_byte()
+            ta2 = yield from self.rx_byte()
+            addr = ta2 << 8 | ta1
+            crc = crc16([cmd, ta1, ta2])
+            while 0x88 <= addr <= 0x8F:
+                v = self.regs[addr-0x88]
+                crc = crc16([v], crc)
+                yield from self.tx_byte(v)
+                addr += 1
+            crc ^= 0xFFFF
+            yield from self.tx_bytes([crc & 0xFF, crc >> 8])
+        elif cmd==0xF5:     # CHANNEL ACCESS READ
+            while True:
+                self.update()
+                yield from self.tx_byte(self.regs[0])
+        elif cmd==0x5A:     # CHANNEL ACCESS WRITE, repeatable
+            while True:
+                d = yield from self.rx_byte()
+                c = yield from self.rx_byte()
+                if d ^ c != 0xFF:
+                    break
+                self.regs[1] = d
+                self.update()
+                yield from self.tx_bytes([0xAA, self.regs[0]])
+        elif cmd==0xCC:     # WRITE CONDITIONAL SEARCH REGISTER
+            ta1 = yield from self.rx_byte()
+            ta2 = yield from self.rx_byte()
+            addr = ta2 << 8 | ta1
+            while 0x8B <= addr <= 0x8D:
+                v = yield from self.rx_byte()
+                if addr==0x8D:  # only PLS, CT, ROS writable; PORL cleared
+                    v = self.regs[5] & 0xF0 | v & 0x07
+                self.regs[addr-0x88] = v
+                addr += 1
+        elif cmd==0xC3:     # RESET ACTIVITY LATCHES
+            self.regs[2] = 0
+            while True:
+                yield from self.tx_byte(0xAA)
+        yield from self.idle()
+
+
+class DS2423(Device):
+    """Emulated 4kb RAM with counters; counts[i] is the counter of page 12+i (A: 14, B: 15)"""
+
+    def __init__(self, sn: str):
+        super().__init__(sn)
+        self.memory = bytearray(512)
+        self.counts = [0, 0, 0, 0]
+
+    def function(self):
+        cmd = yield from self.rx_byte()
+        if cmd==0xA5:       # READ MEMORY + COUNTER, page to page, each with counter, zeros, and inverted CRC16
+            ta1 = yield from self.rx_byte()
+            ta2 = yield from self.rx_byte()
+            addr = ta2 << 8 | ta1
+            crc = crc16([cmd, ta1, ta2])
+            while addr < 512:
+                page = addr >> 5
+                data = bytes(self.memory[addr:(page+1) << 5])
+                count = self.counts[page-12] if page >= 12 else 0xFFFFFFFF
+                data += count.to_bytes(4, 'little') + bytes(4)
+                crc = crc16(data, crc) ^ 0xFFFF
+                yield from self.tx_bytes(data + bytes([crc & 0xFF, crc >> 8]))
+                addr = (page+1) << 5
+                crc = 0
+        yield from self.idle()
+
+
+class DS2438(Device):
+    """Emulated battery gauge; temp in C, vdd and vad in V, current as raw A/D counts"""
+
+    def __init__(self, sn: str, temp: float=21.5, vdd: float=5.0, vad: float=3.3, current: int=0):
+        super().__init__(sn)
+        self.temp = temp
+        self.vdd = vdd
+        self.vad = vad
+        self.current = current
+        self.pages = [bytearray(8) for i in range(8)]
+        self.pages[0][0] = 0x0F     # power-on config: IAD, CA, EE, AD
+        self.sp = [bytearray(8) for i in range(8)]
+        self.conversions = 0
+
+    def function(self):
+        cmd = yield from self.rx_byte()
+        p0 = self.pages[0]
+        if cmd==0x44:       # CONVERT T
+            raw = int(round(self.temp * 256)) & 0xFFF8 & 0xFFFF
+            p0[1], p0[2] = raw & 0xFF, raw >> 8
+            self.conversions += 1
+        elif cmd==0xB4:     # CONVERT V, input per AD
+            raw = int(round((self.vdd if p0[0] & 0x08 else self.vad) * 100)) & 0x3FF
+            p0[3], p0[4] = raw & 0xFF, raw >> 8
+            self.conversions += 1
+        elif cmd in (0xB8, 0xBE, 0x4E, 0x48):
+            page = (yield from self.rx_byte()) & 7
+            if page==0 and p0[0] & 0x01:    # current A/D runs continuously
+                raw = self.current & 0xFFFF
+                p0[5], p0[6] = raw & 0xFF, raw >> 8
+            if cmd==0xB8:   # RECALL MEMORY page
+                self.sp[page][:] = self.pages[page]
+            elif cmd==0xBE: # READ SCRATCHPAD page
+                yield from self.tx_bytes(bytes(self.sp[page]) + bytes([crc8(self.sp[page])]))
+            elif cmd==0x4E: # WRITE SCRATCHPAD page
+                for i in range(8):
+                    self.sp[page][i] = yield from self.rx_byte()
+            else:           # COPY SCRATCHPAD page
+                self.pages[page][:] = self.sp[page]
+        yield from self.idle()
+
+
+class DS2413(Device):
+    """Emulated 2-bit port"""
+    OVERDRIVE = True
+    RESUME = True
+
+    def __init__(self, sn: str):
+        super().__init__(sn)
+        self.latch = 0x03
+        self.ext = 0x03
+
+    def status(self) -> int:
+        pins = self.latch & self.ext
+        s = (pins & 1) | (self.latch & 1) << 1 | (pins & 2) << 1 | (self.latch & 2) << 2
+        return s | (~s & 0x0F) << 4
+
+    def function(self):
+        cmd = yield from self.rx_byte()
+        if cmd==0xF5:       # PIO ACCESS READ
+            while True:
+                yield from self.tx_byte(self.status())
+        elif cmd==0x5A:     # PIO ACCESS WRITE
+            while True:
+                d = yield from self.rx_byte()
+                c = yield from self.rx_byte()
+                if d ^ c != 0xFF:
+                    break
+                self.latch = d & 0x03
+                yield from self.tx_bytes([0xAA, self.status()])
+        yield from self.idle()
+
+
 class OneWire:
     """A class to represent low-level 1-Wire IO."""
-    SEARCH_ROM = 0xF0
-    MODE_UNDEF = 0
-    MODE_CMD = 1
-    MODE_MATCH = 2
-    MODE_SEARCH = 3
 
     def __init__(self, pin) -> None:
         self.pin = pin
-        self.bit = 0
-        self.mode = self.MODE_UNDEF
-        self.cmd = 0
-        self.search = {'state': True, 't':None, 'c':None}
         self.devices = []
+        self.resets = 0     # operation accounting
+        self.slots = 0
+        self.od = 0         # master speed: 0 standard, 1 overdrive
+        self.us = [0, 0]    # emulated bus time (us) by speed
 
-    def init(self, addresses: list) -> dict:
+    def init(self, addresses: list) -> None:
+        """Adds ROM only (i.e. search) devices by serial number"""
         for sn in addresses:
-            bits = ''
-            sn = sn.replace(' ','')
-            pairs = [sn[i:i+2] for i in range(0,len(sn),2)]
-            for p in pairs:
-                bits = hex2bits(p) + bits
-            self.devices.append({'sn':sn, 'bits': bits[::-1], 'active': False })
-
-    def deinit() -> None:
+            self.devices.append(Device(sn))
+
+    def add(self, device: Device) -> Device:
+        self.devices.append(device)
+        return device
+
+    def deinit(self) -> None:
         pass
 
-    def __enter___():
+    def __enter__(self):
         return self
 
-    def __exit() -> None:
+    def __exit__(self, *args) -> None:
         pass
 
-    def reset(self) -> bool:
-        self.bit = 0
-        self.cmd = 0
-        self.mode = self.MODE_CMD
-        for d in self.devices:
-            d["active"] = True
-        return len(self.devices)==0
+    def speed(self, overdrive: bool) -> bool:
+        """Sets master speed; transport interface (optional)"""
+        self.od = 1 if overdrive else 0
+        return True
 
-    def read_bit(self) -> bool:
-        if self.mode==self.MODE_CMD:
-            self.write_bit(True)
-            return True
-        elif self.mode==self.MODE_SEARCH:
-            if self.search['state']==True:
-                self.__seek()
-                return self.search['t']
-            elif self.search['state']==False:
-                self.search['state'] = None
-                return self.search['c']
-            else:
-                print('error: search expecting a write value' )
-                return None
+    def reset(self, test: bool=False) -> bool:
+        self.resets += 1
+        self.us[self.od] += RESET_US[self.od]
+        for d in self.devices:
+            d.gen = None
+            if not self.od:     # standard speed reset returns every device to standard speed
+                d.od = False
+        live = [d for d in self.devices if d.present and d.od==bool(self.od)]
+        for d in live:
+            d.gen = d.run()
+            d.drive = next(d.gen)
+        return len(live)==0
 
-    def __seek(self):
-        t = 1
-        c = 1
+    def slot(self, bit: int) -> int:
+        """One time slot: bus is the wired-AND of master and device drive"""
+        self.slots += 1
+        self.us[self.od] += SLOT_US[self.od]
+        od = bool(self.od)
+        v = bit
+        for d in self.devices:
+            if d.gen and d.od==od:
+                v &= d.drive
         for d in self.devices:
-            if d['active']:
-                t = t & int(d['bits'][self.bit])
-                c = c & (1-int(d['bits'][self.bit]))
-        self.search = {'state':False, 't': t, 'c': c}
+            if d.gen and d.od==od:
+                d.drive = d.gen.send(v)
+        return v
+
+    def read_bit(self) -> bool:
+        return bool(self.slot(1))
 
     def write_bit(self, value: bool) -> None:
-        if self.mode==self.MODE_CMD:
-            self.cmd += value<<self.bit
-            self.bit += 1
-            if self.bit==8:
-                self.bit = 0
-                if self.cmd==self.SEARCH_ROM:
-                    self.mode = self.MODE_SEARCH
-                    self.search = {'state': True, 't':None, 'c':None}
-                    self.bit = 0
-                    print('searching...')
-        elif self.mode==self.MODE_SEARCH and self.search['state']==None:
-            for d in self.devices:
-                if d['active']:
-                    if not int(d['bits'][self.bit])==value:
-                        d['active'] = False
-                        print(f"clash[{self.bit}({value},{d['bits'][self.bit]})]: {d['sn']}")
-                    else:
-                        #print(f"match[{self.bit}({d['bits'][self.bit]})]: {d['sn']} ({d['bits']})")
-                        pass
-            self.bit += 1
-            self.search['state'] = True
-            return None
-        else:
-            print('not ready')
\ No newline at end of file
+        self.slot(1 if value else 0)
+
+    # transport interface block calls...
+    def write_bytes(self, buf) -> None:
+        for value in buf:
+            for i in range(8):
+                self.slot((value >> i) & 1)
+
+    def read_into(self, buf: bytearray) -> bytearray:
+        for n in range(len(buf)):
+            val = 0
+            for i in range(8):
+                val |= self.slot(1) << i
+            buf[n] = val
+        return buf
+
+    def triplet(self, direction: int) -> tuple:
+        bit = self.slot(1)
+        cmp = self.slot(1)
+        if bit and cmp:
+            return 1, 1, 1
+        taken = (direction, bit)[bit!=cmp]
+        self.slot(taken)
+        return bit, cmp, taken
@@ -0,0 +1,171 @@
+# Host benchmark of OneWireBus transport backends against the emulator
+#   bit:   BitBangTransport over the emulator's bit calls (i.e. onewireio path)
+#   block: emulator as native block transport (i.e. model of a byte/block backend such as PIO)
+# reports wall time and calls into the backend (i.e. bit I/O module or block transport) per
+# operation; on hardware each backend call crosses from Python to native code; also times
+# bitwise (emulator reference) vs table driven (onewire_crc) CRCs, emulated bus time per op at
+# standard vs overdrive speed, rom search vs chain mode discovery of a DS28EA00 string, full vs
+# fast (partial scratchpad) temperature reads, and heap per defined device
+# (tracemalloc on host, gc.mem_alloc on the board); run from lib folder
+from time import monotonic_ns
+import gc
+import emulate1wIO
+from onewire import OneWireBus
+from onewire_transport import BitBangTransport
+import onewire_temps, onewire_ports
+import onewire_crc
+
+addresses = [
+    "28 69 2F 2C 0C 32 20 9A",
+    "29 EE D2 02 00 00 00 C3",
+    "29 0B B7 19 00 00 00 6E",
+    "29 E5 D2 02 00 00 00 3B",
+    "29 F1 D2 02 00 00 00 BC",
+    "28 9E A0 16 A8 01 3C B4"
+    ]
+
+class Counted:
+    """Counts calls made to a transport's methods"""
+    def __init__(self, transport):
+        self.transport = transport
+        self.calls = 0
+    def __getattr__(self, name):
+        attr = getattr(self.transport, name)
+        def counted(*args):
+            self.calls += 1
+            return attr(*args)
+        return counted
+
+def emulator():
+    io = emulate1wIO.OneWire('D1')
+    for sn in addresses:
+        io.add(emulate1wIO.DS18B20(sn, 20.0, 0) if sn.startswith('28') else emulate1wIO.DS2408(sn))
+    return io
+
+def bench(name, n=20):
+    if name=='bit':
+        counted = Counted(emulator())
+        transport = BitBangTransport(io=counted)
+    else:
+        counted = Counted(emulator())
+        transport = counted
+    bus = OneWireBus('D1', transport)
+    sensor = bus.define_device(addresses[0], {})
+    port = bus.define_device(addresses[1], {'overdrive': False})  # compare backends at standard speed
+    ops = {
+        'scan': lambda: bus.scan(),
+        'scratchpad': lambda: sensor.scratchpad_read(),
+        'portIn': lambda: port.portIn(),
+        }
+    for op, fn in ops.items():
+        counted.calls = 0
+        t = monotonic_ns()
+        for i in range(n):
+            fn()
+        ms = (monotonic_ns() - t) / 1000000 / n
+        print(f"{name:6} {op:11} {ms:8.3f} ms/op {counted.calls//n:6} calls/op")
+
+print("backend op          time          backend calls")
+bench('bit')
+bench('block')
+
+def crc_bench(n=2000):
+    scratchpad = bytes([0x50, 0x05, 0x4B, 0x46, 0x7F, 0xFF, 0x0C, 0x10, 0x1C])
+    rom = emulate1wIO.rom4sn(addresses[0])
+    cases = {
+        'crc8 sp':  (emulate1wIO.crc8, onewire_crc.crc8, scratchpad),
+        'crc8 rom': (emulate1wIO.crc8, onewire_crc.crc8, rom),
+        'crc16 32': (emulate1wIO.crc16, onewire_crc.crc16, bytes(range(32))),
+        }
+    for case, (bitwise, table, data) in cases.items():
+        us = []
+        for fn in (bitwise, table):
+            t = monotonic_ns()
+            for i in range(n):
+                fn(data)
+            us.append((monotonic_ns() - t) / 1000 / n)
+        print(f"{case:11} {us[0]:8.2f} us {us[1]:8.2f} us {us[0]/us[1]:6.1f}x")
+
+print("\ncrc         bitwise     table       speedup")
+crc_bench()
+
+def mem_bench(n=50):
+    """Heap bytes per device for n devices of each family (addresses interned beforehand)"""
+    try:
+        import tracemalloc
+        tracemalloc.start()
+        used = lambda: tracemalloc.get_traced_memory()[0]
+    except ImportError:
+        used = gc.mem_alloc
+    bus = OneWireBus('D1', emulator())
+    for family in (0x28, 0x29):
+        sns = []
+        for i in range(n):
+            rom = bytearray([family, i, 1, 2, 3, 4, 5])
+            rom.append(onewire_crc.crc8(rom))
+            sns.append(bus.address(rom))
+        keep = []
+        gc.collect()
+        start = used()
+        for sn in sns:
+            keep.append(bus.define_device(sn, {}))
+        gc.collect()
+        print(f"{type(keep[0]).__name__:11} {(used() - start) / n:8.1f} bytes/device")
+
+def speed_bench(n=20):
+    """Emulated bus time per port op (DS2408) at standard and overdrive speed"""
+    for od in (False, True):
+        io = emulator()
+        bus = OneWireBus('D1', io)
+        port = bus.define_device(addresses[1], {'overdrive': od})
+        other = bus.define_device(addresses[2], {'overdrive': od})
+        ops = {
+            'portIn': lambda: port.portIn(),
+            'alternate': lambda: (port.portIn(), other.portIn()),
+            }
+        for op, fn in ops.items():
+            io.us = [0, 0]
+            for i in range(n):
+                fn()
+            print(f"{('standard','overdrive')[od]:10} {op:10} {io.us[0]//n:7} us std {io.us[1]//n:7} us od")
+
+print("\nspeed      op         bus time")
+speed_bench()
+
+def chain_bench(n=8):
+    """Emulated bus time to discover a string of n DS28EA00 by rom search vs chain mode"""
+    io = emulate1wIO.OneWire('D1')
+    prev = None
+    for i in range(n):
+        rom = bytearray([0x42, (i * 37) & 0xFF, i, 0, 0, 0, 0])
+        rom.append(onewire_crc.crc8(rom))
+        prev = io.add(emulate1wIO.DS28EA00(" ".join(["{:02X}".format(b) for b in rom]), prev=prev))
+    bus = OneWireBus('D1', io)
+    for name, fn in (('search', bus.scan), ('chain', bus.chain)):
+        io.us = [0, 0]
+        io.slots = 0
+        found = fn()
+        print(f"{name:10} {len(found):3} devices {io.us[0]:7} us {io.slots:6} slots")
+
+print("\ndiscovery  DS28EA00 string")
+chain_bench()
+
+def fast_bench(n=20):
+    """Emulated bus time per temperature read, full scratchpad vs fast (temperature bytes only)"""
+    io = emulator()
+    bus = OneWireBus('D1', io)
+    sensor = bus.define_device(addresses[0], {})
+    sensor.convert()    # a converted reading rather than the power-on value
+    for fast in (False, True):
+        bus.fast = fast
+        sensor.read_raw()   # fast mode needs one verified (full) read
+        io.us = [0, 0]
+        for i in range(n):
+            sensor.read_raw()
+        print(f"{('full','fast')[fast]:10} {io.us[0]//n:7} us {bus.fast_reads:4} fast {bus.fast_suspect:4} suspect")
+
+print("\nread       temperature")
+fast_bench()
+
+print("\ndevice      heap")
+mem_bench()
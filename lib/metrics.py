@@ -0,0 +1,167 @@
+"""
+Metrics Library for QTPy Broker
+(C) 2024 Enchanted Engineering
+ """
+
+import gc
+
+COUNTER = 0
+GAUGE = 1
+HISTOGRAM = 2
+
+# registry of counters, gauges, and fixed bucket histograms keyed by (interned) name...
+#   a name is assigned a slot on first use, after which updates are a dict lookup and a list
+#   store, so use string literals or names built once (e.g. in __init__) rather than per call
+class Metrics:
+
+    def __init__(self):
+        self.slots = {}     # name -> slot index
+        self.names = []     # slot index -> name
+        self.kinds = []     # slot index -> COUNTER, GAUGE, or HISTOGRAM
+        self.values = []    # slot index -> value, or bucket counts list for histograms
+        self.bounds = []    # slot index -> histogram bucket upper bounds, else None
+        self.last = []      # slot index -> value at last delta read
+
+    def slot(self, name, kind=COUNTER, bounds=None):
+        """Returns the slot for name, allocating it (and histogram buckets) on first use"""
+        i = self.slots.get(name)
+        if i==None:
+            i = len(self.names)
+            self.slots[name] = i
+            self.names.append(name)
+            self.kinds.append(kind)
+            self.bounds.append(bounds)
+            if kind==HISTOGRAM:
+                self.values.append([0]*(len(bounds)+1))  # last bucket catches everything above bounds
+                self.last.append([0]*(len(bounds)+1))
+            else:
+                self.values.append(0)
+                self.last.append(0)
+        return i
+
+    def count(self, name, n=1):
+        i = self.slots.get(name)
+        if i==None:
+            i = self.slot(name)
+        self.values[i] += n
+
+    def gauge(self, name, value):
+        i = self.slots.get(name)
+        if i==None:
+            i = self.slot(name, GAUGE)
+        self.values[i] = value
+
+    def peak(self, name, value):
+        """Gauge that only records a new high-water mark"""
+        i = self.slots.get(name)
+        if i==None:
+            i = self.slot(name, GAUGE)
+        if value > self.values[i]:
+            self.values[i] = value
+
+    def histogram(self, name, bounds):
+        """Defines a histogram with fixed buckets given as ascending upper bounds"""
+        return self.slot(name, HISTOGRAM, tuple(bounds))
+
+    def observe(self, name, value):
+        i = self.slots.get(name)
+        if i==None:
+            return  # histograms must be defined first
+        b = self.bounds[i]
+        k = 0
+        n = len(b)
+        while k < n and value > b[k]:
+            k += 1
+        self.values[i][k] += 1
+
+    def read(self, prefix=None, delta=False):
+        """Snapshot of metrics (optionally by name prefix); delta reports changes since the last delta read"""
+        snap = {}
+        for i, name in enumerate(self.names):
+            if prefix and not name.startswith(prefix):
+                continue
+            v = self.values[i]
+            if self.kinds[i]==HISTOGRAM:
+                if delta:
+                    last = self.last[i]
+                    snap[name] = {'le': self.bounds[i], 'n': [c - last[k] for k, c in enumerate(v)]}
+                    self.last[i] = v.copy()
+                else:
+                    snap[name] = {'le': self.bounds[i], 'n': v.copy()}
+            elif delta and self.kinds[i]==COUNTER:
+                snap[name] = v - self.last[i]
+                self.last[i] = v
+            else:
+                snap[name] = v
+        return snap
+
+    def reset(self, prefix=None):
+        for i, name in enumerate(self.names):
+            if prefix and not name.startswith(prefix):
+                continue
+            if self.kinds[i]==HISTOGRAM:
+                n = len(self.values[i])
+                self.values[i] = [0]*n
+                self.last[i] = [0]*n
+            else:
+                self.values[i] = 0
+                self.last[i] = 0
+
+metrics = Metrics() # shared registry for broker, queues, and drivers
+
+
+# heap usage per code section (i.e. loop phases and driver calls), sampled via gc...
+#   gc.mem_alloc walks the heap allocation table, so sampling is off unless enabled
+#   sections: name -> [calls, total bytes allocated, max bytes allocated in one call, peak heap in use]
+class Heap:
+
+    def __init__(self):
+        self.enabled = False
+        self.sections = {}
+        self.mem_alloc = getattr(gc,'mem_alloc',None)   # not available on host python
+        self.mem_free = getattr(gc,'mem_free',None)
+
+    def enable(self, state=True):
+        self.enabled = bool(state) and self.mem_alloc!=None
+        return self.enabled
+
+    def start(self):
+        """Returns a heap mark to pass to lap; zero when disabled"""
+        return self.mem_alloc() if self.enabled else 0
+
+    def lap(self, name, mark):
+        """Records allocation since mark against section name and returns a new mark"""
+        if not self.enabled:
+            return 0
+        used = self.mem_alloc()
+        alloc = used - mark
+        if alloc < 0:   # a collection ran within the section; allocation unknown
+            metrics.count('mem.gc')
+            alloc = 0
+        s = self.sections.get(name)
+        if s==None:
+            s = self.sections[name] = [0, 0, 0, 0]
+        s[0] += 1
+        s[1] += alloc
+        if alloc > s[2]:
+            s[2] = alloc
+        if used > s[3]:
+            s[3] = used
+        metrics.peak('mem.peak', used)
+        return self.mem_alloc()     # exclude own bookkeeping from next section
+
+    def report(self, top=5):
+        """Summary of the heaviest allocating sections by total bytes allocated"""
+        ranked = sorted(self.sections.items(), key=lambda x: x[1][1], reverse=True)
+        rpt = {
+            'enabled': self.enabled,
+            'free': self.mem_free() if self.mem_free else None,
+            'alloc': self.mem_alloc() if self.mem_alloc else None,
+            'top': [{'name': k, 'calls': v[0], 'bytes': v[1], 'max': v[2], 'peak': v[3]} for k, v in ranked[:top]]
+            }
+        return rpt
+
+    def reset(self):
+        self.sections = {}
+
+heap = Heap()   # shared heap sampler for broker loop and drivers
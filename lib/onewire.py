@@ -5,8 +5,9 @@
 ====================================================
 Implements a full 1-Wire bus protocol supporting an extendible set of devices
 OneWireBus includes direct interface to low level reset, bit read, and bit 
-write operations of the core onewireio module, as well as higher level-byte 
-and block (i.e. bytearray) read/write operations and device discovery (scan).
+write operations of a transport (default onewireio core module, see 
+onewire_transport), as well as higher level-byte and block (i.e. bytearray)
+read/write operations and device discovery (scan).
 See readme for details 
 
 * Author(s): CanyonCasa
@@ -15,9 +16,12 @@ See readme for details
 #__version__ = "0.0.0-auto.0"
 #__repo__ = "https://github.com/CanyonCasa/Custom-Node-Red-Nodes"
 
-from microcontroller import Pin
-from onewireio import OneWire
-import digitalio
+try:
+    from microcontroller import Pin
+except ImportError:     # host (i.e. emulator) runs
+    Pin = None
+from onewire_transport import BitBangTransport
+from onewire_crc import crc8, crc16, CRC16_RESIDUE
 from time import monotonic_ns, sleep
 
 from scribe import Scribe
@@ -27,30 +31,195 @@ scribe = Scribe('WIRE').scribe
 def millis():
     return monotonic_ns() // 1000000
 
+class Address:
+    """Immutable 1-Wire address; rom bytes parsed once and each string form built on first use.
+       Interned per bus (see OneWireBus.address) so scans, alias tables, and devices share one object.
+       Indexing by form name (e.g. a['sn']) or byte position (a[0]) keeps address dict compatibility"""
+    __slots__ = ('rom', 'family', '_sn', '_hex', '_rpi', '_reverse')
+    FORMS = ('family', 'rom', 'sn', 'hex', 'rpi', 'reverse')
+
+    def __init__(self, rom) -> None:
+        self.rom = bytes(rom)
+        self.family = self.rom[0]
+        self._sn = None
+        self._hex = None
+        self._rpi = None
+        self._reverse = None
+
+    @property
+    def sn(self) -> str:
+        """de facto hex string format"""
+        if self._sn==None:
+            self._sn = " ".join(["{:02X}".format(b) for b in self.rom])
+        return self._sn
+
+    @property
+    def hex(self) -> str:
+        """hex string, no spaces"""
+        if self._hex==None:
+            self._hex = "".join(["{:02X}".format(b) for b in self.rom])
+        return self._hex
+
+    @property
+    def rpi(self) -> str:
+        """rpi/node-red format"""
+        if self._rpi==None:
+            self._rpi = "{:02x}-".format(self.rom[0]) + "".join(["{:02x}".format(self.rom[i]) for i in range(6,0,-1)])
+        return self._rpi
+
+    @property
+    def reverse(self) -> str:
+        """hex string, reverse byte order"""
+        if self._reverse==None:
+            self._reverse = " ".join(["{:02X}".format(self.rom[i]) for i in range(7,-1,-1)])
+        return self._reverse
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.rom[key]
+        return getattr(self, key)
+
+    def keys(self):
+        return self.FORMS
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Address) and other.rom==self.rom
+
+    def __hash__(self) -> int:
+        return hash(self.rom)
+
+    def __repr__(self) -> str:
+        return self.sn
+
+    def asdict(self) -> dict:
+        """Address forms as a dict for replies; rom as its legacy string form"""
+        return {'family': self.family, 'rom': str(bytearray(self.rom)), 'sn': self.sn, 'hex': self.hex,
+            'rpi': self.rpi, 'reverse': self.reverse}
+
+
 class OneWireBus:
     """A class to represent a 1-Wire bus/pin."""
     # OneWire bus commands...
     SEARCH_ROM = 0xF0
+    ALARM_SEARCH = 0xEC     # conditional search; only devices with an alarm condition participate
+    OD_SKIP_ROM = 0x3C      # overdrive skip; all overdrive capable devices enter overdrive
+    OD_MATCH_ROM = 0x69     # overdrive match; rom follows at overdrive speed, selected device enters overdrive
+    RESUME = 0xA5           # reselects the last matched device (i.e. its RC flag) without sending its rom
+    COND_READ_ROM = 0x0F    # chain mode: rom of the one enabled device (EN low) not yet done; DS28EA00 only
+    CHAIN = 0x99            # DS28EA00 chain function, control code and its complement follow, 0xAA confirms
+    CHAIN_OFF = 0x3C
+    CHAIN_ON = 0x5A
+    CHAIN_DONE = 0x96       # device drives its PIOA (DONE) low, enabling the next device in the chain
     REGISTERED = {}     # defined device types used to auto assign found devices
 
-    def __init__(self, pin: Pin) -> None:
+    def __init__(self, pin: Pin, transport=None) -> None:
         self.pin = pin
-        self.io = OneWire(self.pin)
+        self.io = transport if transport else BitBangTransport(pin)
         self.timex = None
-
-    # reset, read_bit, and write_bit functions wrapped because testing bus reassigns io
+        self.resets = 0     # reset count; any reset ends the transaction of the last command
+        self.addresses = {} # interned Address objects by rom bytes and by hex string as given
+        self.od_ok = hasattr(self.io,'speed')  # transport can run overdrive
+        self.od = False     # master at overdrive speed
+        self.od_roms = []   # roms put in overdrive since the last standard speed reset
+        self.od_all = False # overdrive skip put every capable device in overdrive
+        self.od_seen = []   # roms confirmed to answer at overdrive speed
+        self.od_fallbacks = 0   # overdrive transactions failed and returned to standard speed
+        self.last = None    # rom of the last matched device (session holder), None after skip or search
+        self.resumes = 0    # selects done by RESUME; each saves 64 time slots of rom
+        self.recorder = None    # optional transaction recorder wrapping the transport (see record)
+        self.fast = False   # temperature reads take only the temperature bytes (see TemperatureSensor.read_raw)
+        self.fast_reads = 0     # partial scratchpad reads
+        self.fast_suspect = 0   # partial reads failing plausibility checks, so repeated in full
+        self.crc_errors = 0     # full scratchpad reads failing CRC
+
+    # reset, read_bit, and write_bit wrap the transport so the rest of the stack is backend independent
     def reset(self, test: bool=False) -> bool:
-        """Perform a bus reset"""
-        # patch until reset stuck low fix to onewireio reset 
-        if test:
-            self.io.deinit()
-            x = digitalio.DigitalInOut(self.pin)
-            state = x.value
-            x.deinit()
-            self.io = OneWire(self.pin)
-            if not state:
-                return True # bus stuck low failure
-        return self.io.reset()
+        """Perform a bus reset at the current speed; at standard speed it returns all devices to standard"""
+        self.resets += 1
+        if not self.od:
+            self.od_roms = []
+            self.od_all = False
+        return self.io.reset(test)
+
+    def record(self, size: int=32):
+        """Starts, resizes (clearing), or with size 0 stops a transaction recorder around the transport"""
+        if self.recorder:
+            self.io = self.recorder.transport
+            self.recorder = None
+        if size:
+            from onewire_transport import Recorder
+            self.recorder = Recorder(self.io, size)
+            self.io = self.recorder
+        return self.recorder
+
+    def speed(self, od: bool) -> bool:
+        """Sets master speed, standard or overdrive; False if the transport cannot run overdrive"""
+        if od==self.od:
+            return True
+        if od and not self.od_ok:
+            return False
+        self.io.speed(od)
+        self.od = od
+        return True
+
+    def overdrive_skip(self) -> bool:
+        """Puts every overdrive capable device in overdrive (i.e. ahead of a run of overdrive transactions)"""
+        if not self.od_ok or not self.speed(False) or self.reset():
+            return False
+        self.writebyte(OneWireBus.OD_SKIP_ROM)
+        self.last = None
+        self.speed(True)
+        self.od_all = True
+        return True
+
+    def match(self, rom: bytes, resume: bool=False) -> None:
+        """Selects a device after a reset: by RESUME when it holds the session and its family supports it, else MATCH ROM"""
+        if resume and self.last==rom:
+            self.writebyte(OneWireBus.RESUME)
+            self.resumes += 1
+        else:
+            self.write(bytes((Device.MATCH_ROM,)) + rom)
+            self.last = rom
+
+    def skip(self) -> None:
+        """Addresses all devices after a reset; ends any session"""
+        self.writebyte(Device.SKIP_ROM)
+        self.last = None
+
+    def od_select(self, rom: bytes, skip: bool=False, resume: bool=False) -> bool:
+        """Selects an overdrive capable device at overdrive speed. False when the device did not answer.
+             in overdrive already:  overdrive reset and match (or skip) at overdrive speed
+             first use:             overdrive match from standard speed, confirmed by an overdrive reset
+             confirmed before:      overdrive skip from standard speed, so every capable device stays in
+                                    overdrive for later selects, then overdrive reset and match"""
+        if self.od and (rom in self.od_roms or (self.od_all and rom in self.od_seen)):
+            if self.reset():    # overdrive reset; only devices in overdrive present
+                return False
+            if skip:
+                self.skip()
+            else:
+                self.match(rom, resume)
+            return True
+        if skip or rom in self.od_seen:
+            if not self.overdrive_skip():
+                return False
+            if skip:
+                return True
+        else:
+            self.speed(False)
+            if self.reset():
+                return False
+            self.writebyte(OneWireBus.OD_MATCH_ROM)
+            self.speed(True)
+            self.write(rom)
+            self.last = rom
+            self.od_roms.append(rom)
+        if self.reset():    # only the matched device is in overdrive, so presence confirms it
+            return False
+        if not rom in self.od_seen:
+            self.od_seen.append(rom)
+        self.match(rom, resume)
+        return True
 
     def readbit(self) -> bool:
         """Reads a single bit from the bus"""
@@ -78,20 +247,11 @@ class OneWireBus:
             self.timex = millis() + wait
 
     @staticmethod
-    def crc8(data: bytearray) -> int:
+    def crc8(data: bytearray, crc: int=0) -> int:
         """Perform the 1-Wire CRC check on the provided data. Returns 0 for successful 8 byte crc"""
         if data==None:
             return None
-        crc = 0
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x01:
-                    crc = (crc >> 1) ^ 0x8C
-                else:
-                    crc >>= 1
-                crc &= 0xFF
-        return crc
+        return crc8(data, crc)
 
     @staticmethod
     def crc8snx(data: bytearray) -> int:
@@ -101,32 +261,20 @@ class OneWireBus:
         if OneWireBus.REGISTERED.get(data[0]):
             if hasattr(OneWireBus.REGISTERED[data[0]],'MASK'):
                 data[1] = OneWireBus.REGISTERED[data[0]].MASK
-        return OneWireBus.crc8(data)
+        return crc8(data)
 
     @staticmethod
     def crc16i(data: bytearray, seed: int = 0, invert: bool=True, as_bytes: bool=True):
         """Generates CRC16; inverted, as bytearray, by default for appending to data block"""
-        oddparity = [0, 1, 1, 0, 1, 0, 0, 1, 1, 0, 0, 1, 0, 1, 1, 0]
-        crc = seed
-        for i in range(len(data)):
-            cdata = data[i]
-            cdata = (cdata ^ crc) & 0xFF
-            crc = crc >> 8
-            if oddparity[cdata & 0x0F] ^ oddparity[cdata >> 4]:
-                crc = crc ^ 0xC001
-            cdata = cdata << 6
-            crc = crc ^ cdata
-            cdata = cdata << 1
-            crc = crc ^ cdata
+        crc = crc16(data, seed)
         if invert:
             crc = crc ^ 0xFFFF
         return crc if not as_bytes else bytearray([crc&0xFF,(crc>>8)&0xFF])
 
     @staticmethod
-    def crc16check(data: bytearray):
+    def crc16check(data: bytearray, seed: int=0):
         """Checks a data block with an inverted crc16 and return zero for valid data"""
-        crc = OneWireBus.crc16i(data, 0, False, False)
-        return crc ^ 0xB001
+        return crc16(data, seed) ^ CRC16_RESIDUE
 
     @staticmethod
     def bytes2hex(b: bytearray) -> str:
@@ -138,7 +286,9 @@ class OneWireBus:
         """Converts an address of various forms to rom bytearray for I/O calls"""
         if type(address)==dict:    # assume direct from scan function
             return address['rom']
-        elif type(address)==bytearray:
+        elif isinstance(address, Address):
+            return address.rom
+        elif type(address)==bytearray or type(address)==bytes:
             return address
         elif type(address)==str:    # hex string with or w/o spaces or rpi/node-red format
             astr = address.replace(' ','').replace('-','')
@@ -151,68 +301,75 @@ class OneWireBus:
             return None
 
     @staticmethod
-    def frmt_addr(rom) -> dict:
-        """Converts a rom bytearray into multiple address forms for display, etc"""
+    def frmt_addr(rom) -> Address:
+        """Converts a rom bytearray into multiple address forms for display, etc (not interned; see address)"""
         if rom == None:
             return {'family': None,'rom': None, 'sn': None, 'hex':None,'rpi': None,'reverse': None}
-        family = rom[0]
-        sn = OneWireBus.bytes2hex(rom)    # defacto hex string
-        hxx = sn.replace(' ','')    # hexstring, no spaces
-        #rpi = (hxx[:2] + '-' + hxx[2:14]).lower()    # rpi/node-red format
-        rpi = (hxx[:2] + '-' + ''.join([hxx[i-1]+hxx[i] for i in range(13,2,-2)])).lower()    # rpi/node-red format
-        rev = ' '.join(sn.split(' ')[::-1]) # reverse order
-        return {'family': family,'rom': rom, 'sn': sn, 'hex':hxx,'rpi': rpi,'reverse': rev}
+        return Address(rom)
+
+    def address(self, address: any) -> Address:
+        """Interned Address for any address form; hex strings and rom bytes are parsed only once per bus"""
+        if isinstance(address, Address):
+            return address
+        key = address if type(address)==str else bytes(self.bytes4addr(address) or b'')
+        a = self.addresses.get(key)
+        if a==None:
+            rom = self.bytes4addr(address)
+            if not rom: return None
+            rom = bytes(rom)
+            a = self.addresses.get(rom)
+            if a==None:
+                a = self.addresses[rom] = Address(rom)
+            self.addresses[key] = a
+        return a
 
     def define_device(self, address, params: dict={}, dev_class=None):
         """Associates a specific device with its bus"""
         if not address:
             return Device(self,None,params)
-        abytes = self.bytes4addr(address)
-        if not abytes: return None
-        family = abytes[0]
-        dclass = dev_class if not dev_class==None else OneWireBus.REGISTERED.get(family,Device)
-        return dclass(self, abytes, params)
+        addr = self.address(address)
+        if not addr: return None
+        dclass = dev_class if not dev_class==None else OneWireBus.REGISTERED.get(addr.family,Device)
+        return dclass(self, addr, params)
 
     def read(self, n: int) -> bytearray:
         """Reads n number of bytes from the bus and returns as a bytearray."""
         buf = bytearray(n) if type(n)==int else n   # accomodate a buffer or buffer size
-        for i in range(n):
-            buf[i] = self.readbyte()
-        return buf
+        return self.io.read_into(buf)
 
     def readbyte(self) -> int:
         """Read a single byte from the data bus"""
-        val = 0
-        for i in range(8):
-            val |= self.readbit() << i
-        return val
+        return self.io.read_into(bytearray(1))[0]
 
     @staticmethod
     def register(family: int, device_class):
         """Adds a device class to the list of registered device classes"""
         OneWireBus.REGISTERED[family] = device_class
 
-    def scan(self,family=None) -> list:
+    def scan(self,family=None,alarm=False) -> list:
         """Scan bus for devices present and return a list of valid multi-format addresses for each."""
            # if family defined, searches only for devices matching that family.
+           # if alarm, searches only devices reporting an alarm condition (i.e. alarm search)
            # searches "zero branch" first; i.e. left-to-right binary tree
            # walks back conflicts from MSB to LSB
         addresses = []
+        cmd = OneWireBus.ALARM_SEARCH if alarm else OneWireBus.SEARCH_ROM
         seed = bytearray([0]*8) # start with all zeros
         if family:  # override first byte with family if defined
             seed[0] = int(family,16) if isinstance(family,str) else family
         while True: # loop until no conflicts remain...
-            rom, conflicts = self._search_rom(seed) # perform a single pass to discover a single device
+            rom, conflicts = self._search_rom(seed, cmd) # perform a single pass to discover a single device
             if rom==None:
                 break
             if conflicts==None: # conflicts==None for errors!
                 scribe(f"ERROR[OneWireBus.scan]: NO devices present of stuck bus!")
                 break
+            if family and rom[0]!=seed[0]:  # search left the family path, so no (more) family devices
+                break
             if self.crc8snx(rom) == 0: # rom as bytearray; zero crc for a valid address
-                dev = self.frmt_addr(rom)
-                addresses.append(dev)
+                addresses.append(self.address(rom))
             else:
-                scribe(f"ERROR[OneWireBus.scan]: failed CRC! Device {dev['sn']} ignored")
+                scribe(f"ERROR[OneWireBus.scan]: failed CRC! Device {self.bytes2hex(rom)} ignored")
                 break
             if not len(conflicts):  # no more conflicts, done!
                 break
@@ -231,8 +388,69 @@ class OneWireBus:
                     break
         return addresses
 
+    def verify(self, rom: bytearray, known: list=[]) -> tuple:
+        """Targeted search for one known rom (i.e. seeded with it, one pass rather than a full scan).
+           Returns (present, unknown): unknown is True when the pass shows a device not among known roms,
+           i.e. a search conflict no known rom accounts for, so a full scan is needed to find it"""
+        found, conflicts = self._search_rom(rom)
+        if found==None or conflicts==None:
+            return False, False
+        if found!=rom:  # absent; the pass ended on whichever device took over the path
+            return False, not found in known
+        expected = []   # first bit where each other known rom leaves this rom's path
+        for k in known:
+            for byte in range(8):
+                x = k[byte] ^ rom[byte]
+                if x:
+                    bit = 0
+                    while not x >> bit & 1:
+                        bit += 1
+                    expected.append((byte, bit))
+                    break
+        for c in conflicts:
+            if not c in expected:
+                return True, True
+        return True, False
+
+    def chain_control(self, code: int, rom: bytes=None) -> bool:
+        """Sends a chain control code to all devices (SKIP ROM) or to rom; True when confirmed"""
+        if self.reset():
+            return False
+        if rom:
+            self.match(rom, True)
+        else:
+            self.skip()
+        self.write(bytes((OneWireBus.CHAIN, code, code ^ 0xFF)))
+        return self.read(1)[0]==0xAA
+
+    def chain(self) -> list:
+        """Discovers a string of DS28EA00 devices in physical order by chain mode: each pass reads the rom of
+           the enabled device (conditional read rom) and marks it done (by RESUME), which enables the next.
+           Returns the addresses in chain order, or None when no device confirms chain mode"""
+        self.speed(False)
+        if not self.chain_control(OneWireBus.CHAIN_ON):
+            return None
+        addresses = []
+        while not self.reset():
+            self.writebyte(OneWireBus.COND_READ_ROM)
+            rom = bytes(self.read(8))
+            if rom==b'\xff'*8:   # no device responded, end of chain
+                break
+            if self.crc8snx(rom):
+                scribe(f"ERROR[OneWireBus.chain]: failed CRC! Device {self.bytes2hex(rom)} ignored")
+                break
+            self.last = rom     # read rom sets the device's RC flag
+            address = self.address(rom)
+            if address in addresses or not self.chain_control(OneWireBus.CHAIN_DONE, rom):
+                scribe(f"ERROR[OneWireBus.chain]: Device {address.sn} failed to leave the chain")
+                break
+            addresses.append(address)
+        self.chain_control(OneWireBus.CHAIN_OFF)
+        return addresses
+
     def status(self,dump=False):
         """Reports on bus health; optionally dumps to console"""
+        self.speed(False)
         r = self.reset(True)
         if dump:
             scribe(f"Reset: {('Bus OK', 'Bus fault/no devices')[r]}")
@@ -243,80 +461,107 @@ class OneWireBus:
         
     def write(self, buf: bytearray) -> None:
         """Write the bytes from ``buf`` to the bus."""
-        for i in range(len(buf)):
-            self.writebyte(buf[i])
+        self.io.write_bytes(buf)
 
     def writebyte(self, value: int) -> None:
         """Writes a single byte of data to the bus"""
-        for i in range(8):
-            bit = (value >> i) & 0x1
-            self.writebit(bit)
+        self.io.write_bytes((value,))
 
-    def _search_rom(self, seed: bytearray) -> tuple: # (bytearray, array)
+    def _search_rom(self, seed: bytearray, cmd: int=SEARCH_ROM) -> tuple: # (bytearray, array)
         """Internal routine used by scan for device discovery; works like DS2480B w/o interleaving"""
+        self.speed(False)   # searches run at standard speed so every device takes part
         if self.reset(True):    # False when any devices present; tests for stuck bus
             return None, None
+        self.last = None
         # set search mode: read true bit; read complement bit; write true bit or seed bit for a conflict
-        self.writebyte(OneWireBus.SEARCH_ROM)
+        self.writebyte(cmd)
         rom = bytearray(8)
         conflicts = []
+        triplet = self.io.triplet
         for byte in range(8):
             r_b = 0
             for bit in range(8):
-                n = byte*8 + bit
                 sb = seed[byte] & 1<<bit and 1  # seed bit
-                b = self.readbit()  # 1st address bit read (true)
-                if self.readbit():  # 2nd address bit read (complement)
-                    if b:  # 11: there are no devices or there is an error on the bus
-                        return None, None
-                else:
-                    if not b:  # 00: collision, two devices with different bit states
-                        conflicts += [(byte,bit)]    # mark conflict
-                        b = sb  # replace true bit with seed
-                self.writebit(b)
-                r_b |= b << bit
+                b, c, taken = triplet(sb)   # address bit (true), complement, and bit written
+                if b and c:  # 11: there are no devices or there is an error on the bus
+                    return None, None
+                if not (b or c):  # 00: collision, two devices with different bit states
+                    conflicts += [(byte,bit)]    # mark conflict; seed bit taken
+                r_b |= taken << bit
             rom[byte] = r_b
         return rom, conflicts
 
 
 class Device:
     """A base class to represent any single device on the 1-Wire bus, generally overridden by specific class."""
+    # per-family constants stay at class level; instances hold only slots (see subclasses)
+    __slots__ = ('bus', 'addr', 'desc', 'od')
     CATEGORY = 'bus'
     DESC = 'Generic device, supports bus search'
     FAMILY = None
+    OVERDRIVE = False   # family supports overdrive speed
+    RESUME = False      # family supports RESUME, so consecutive selects of the same device skip its rom
     MATCH_ROM = 0x55
     SKIP_ROM = 0xCC
 
     def __init__(self, bus: OneWireBus, address: any, params: dict={}):
         self.bus = bus  # resident of bus
-        if address:
-            self.address = OneWireBus.bytes4addr(address)   # save address as bytearray
-            self.family = self.address[0]  # extract family code
-            self.sn = self.bus.bytes2hex(self.address)  # de facto hex string format
-        else:
-            self.address = None
-            self.family = Device.FAMILY
-            self.sn = None
-        self.DESC = Device.DESC
-        self.CATEGORY = Device.CATEGORY
+        self.addr = bus.address(address) if address else None  # interned; parsed and formatted once per bus
+        self.desc = params.get('desc',self.DESC)
+        self.od = self.OVERDRIVE and bus.od_ok and params.get('overdrive',True)   # transactions run at overdrive
+
+    @property
+    def address(self) -> bytes:
+        """rom bytes for I/O calls"""
+        return self.addr.rom if self.addr else None
+
+    @property
+    def family(self) -> int:
+        return self.addr.family if self.addr else self.FAMILY
+
+    @property
+    def sn(self) -> str:
+        """de facto hex string format"""
+        return self.addr.sn if self.addr else None
 
     # select a single device on the bus
     def select(self, skip=False) -> None:
-        if not self.address: return
+        if not self.addr: return
+        if self.od:
+            if self.bus.od_select(self.addr.rom, skip, self.RESUME):
+                return
+            self.fallback()
+        self.bus.speed(False)
         if not self.bus.reset():
             if skip:
-                self.bus.write([Device.SKIP_ROM])
+                self.bus.skip()
             else:
-                self.bus.write([Device.MATCH_ROM])
-                self.bus.write(self.address)
+                self.bus.match(self.addr.rom, self.RESUME)
     
-    def search(self,family=None):
-        found = self.bus.scan(family if family else self.family)
+    def fallback(self) -> None:
+        """Overdrive failed for this device; its transactions run at standard speed from now on"""
+        self.od = False
+        self.bus.od_fallbacks += 1
+        self.bus.last = None    # next select rematches at standard speed
+        self.bus.speed(False)
+
+    def search(self,family=None,alarm=False):
+        found = self.bus.scan(family if family else self.family, alarm)
         return found
 
     def info(self):
         return { 'address': self.address, 'family':self.family, 'sn': self.sn, 'desc': self.desc }
 
+    @staticmethod
+    def configure_all(devices: list) -> dict:
+        """Configures devices of one kind in one pass; reports writes done, avoided, and failed reads.
+           Each device's configure returns True if written, False if already set, None on a failed read"""
+        report = {'written': 0, 'skipped': 0, 'failed': 0}
+        for d in devices:
+            r = d.configure()
+            report[('failed','skipped','written')[(r!=None)+(r==True)]] += 1
+        return report
+
     @staticmethod
     def register(family: int, device_class):
         OneWireBus.register(family, device_class)
@@ -0,0 +1,87 @@
+# MIT License
+"""
+`onewire_crc`
+====================================================
+Table driven 1-Wire CRC8 (Dallas/Maxim, x^8+x^5+x^4+1) and CRC16 (x^16+x^15+x^2+1).
+Tables are precomputed 256 entry bytes objects (CRC16 split into low and high byte
+tables) so each data byte costs one lookup instead of an 8 step bit loop.
+Both functions stream: pass the previous result as crc to continue a CRC over
+successive blocks (e.g. as bytes are read), so...
+    crc8(a + b) == crc8(b, crc8(a))
+A block ending with its own CRC8 yields 0; a block ending with its own inverted CRC16
+yields the residue CRC16_RESIDUE.
+
+* Author(s): CanyonCasa
+"""
+
+CRC8_TABLE = (
+    b'\x00\x5e\xbc\xe2\x61\x3f\xdd\x83\xc2\x9c\x7e\x20\xa3\xfd\x1f\x41'
+    b'\x9d\xc3\x21\x7f\xfc\xa2\x40\x1e\x5f\x01\xe3\xbd\x3e\x60\x82\xdc'
+    b'\x23\x7d\x9f\xc1\x42\x1c\xfe\xa0\xe1\xbf\x5d\x03\x80\xde\x3c\x62'
+    b'\xbe\xe0\x02\x5c\xdf\x81\x63\x3d\x7c\x22\xc0\x9e\x1d\x43\xa1\xff'
+    b'\x46\x18\xfa\xa4\x27\x79\x9b\xc5\x84\xda\x38\x66\xe5\xbb\x59\x07'
+    b'\xdb\x85\x67\x39\xba\xe4\x06\x58\x19\x47\xa5\xfb\x78\x26\xc4\x9a'
+    b'\x65\x3b\xd9\x87\x04\x5a\xb8\xe6\xa7\xf9\x1b\x45\xc6\x98\x7a\x24'
+    b'\xf8\xa6\x44\x1a\x99\xc7\x25\x7b\x3a\x64\x86\xd8\x5b\x05\xe7\xb9'
+    b'\x8c\xd2\x30\x6e\xed\xb3\x51\x0f\x4e\x10\xf2\xac\x2f\x71\x93\xcd'
+    b'\x11\x4f\xad\xf3\x70\x2e\xcc\x92\xd3\x8d\x6f\x31\xb2\xec\x0e\x50'
+    b'\xaf\xf1\x13\x4d\xce\x90\x72\x2c\x6d\x33\xd1\x8f\x0c\x52\xb0\xee'
+    b'\x32\x6c\x8e\xd0\x53\x0d\xef\xb1\xf0\xae\x4c\x12\x91\xcf\x2d\x73'
+    b'\xca\x94\x76\x28\xab\xf5\x17\x49\x08\x56\xb4\xea\x69\x37\xd5\x8b'
+    b'\x57\x09\xeb\xb5\x36\x68\x8a\xd4\x95\xcb\x29\x77\xf4\xaa\x48\x16'
+    b'\xe9\xb7\x55\x0b\x88\xd6\x34\x6a\x2b\x75\x97\xc9\x4a\x14\xf6\xa8'
+    b'\x74\x2a\xc8\x96\x15\x4b\xa9\xf7\xb6\xe8\x0a\x54\xd7\x89\x6b\x35')
+
+CRC16_LO = (
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x01\xc0\x80\x41\x00\xc1\x81\x40\x00\xc1\x81\x40\x01\xc0\x80\x41'
+    b'\x00\xc1\x81\x40\x01\xc0\x80\x41\x01\xc0\x80\x41\x00\xc1\x81\x40')
+
+CRC16_HI = (
+    b'\x00\xc0\xc1\x01\xc3\x03\x02\xc2\xc6\x06\x07\xc7\x05\xc5\xc4\x04'
+    b'\xcc\x0c\x0d\xcd\x0f\xcf\xce\x0e\x0a\xca\xcb\x0b\xc9\x09\x08\xc8'
+    b'\xd8\x18\x19\xd9\x1b\xdb\xda\x1a\x1e\xde\xdf\x1f\xdd\x1d\x1c\xdc'
+    b'\x14\xd4\xd5\x15\xd7\x17\x16\xd6\xd2\x12\x13\xd3\x11\xd1\xd0\x10'
+    b'\xf0\x30\x31\xf1\x33\xf3\xf2\x32\x36\xf6\xf7\x37\xf5\x35\x34\xf4'
+    b'\x3c\xfc\xfd\x3d\xff\x3f\x3e\xfe\xfa\x3a\x3b\xfb\x39\xf9\xf8\x38'
+    b'\x28\xe8\xe9\x29\xeb\x2b\x2a\xea\xee\x2e\x2f\xef\x2d\xed\xec\x2c'
+    b'\xe4\x24\x25\xe5\x27\xe7\xe6\x26\x22\xe2\xe3\x23\xe1\x21\x20\xe0'
+    b'\xa0\x60\x61\xa1\x63\xa3\xa2\x62\x66\xa6\xa7\x67\xa5\x65\x64\xa4'
+    b'\x6c\xac\xad\x6d\xaf\x6f\x6e\xae\xaa\x6a\x6b\xab\x69\xa9\xa8\x68'
+    b'\x78\xb8\xb9\x79\xbb\x7b\x7a\xba\xbe\x7e\x7f\xbf\x7d\xbd\xbc\x7c'
+    b'\xb4\x74\x75\xb5\x77\xb7\xb6\x76\x72\xb2\xb3\x73\xb1\x71\x70\xb0'
+    b'\x50\x90\x91\x51\x93\x53\x52\x92\x96\x56\x57\x97\x55\x95\x94\x54'
+    b'\x9c\x5c\x5d\x9d\x5f\x9f\x9e\x5e\x5a\x9a\x9b\x5b\x99\x59\x58\x98'
+    b'\x88\x48\x49\x89\x4b\x8b\x8a\x4a\x4e\x8e\x8f\x4f\x8d\x4d\x4c\x8c'
+    b'\x44\x84\x85\x45\x87\x47\x46\x86\x82\x42\x43\x83\x41\x81\x80\x40')
+
+CRC16_RESIDUE = 0xB001
+
+def crc8(data, crc: int=0) -> int:
+    """CRC8 of data (any sequence of ints), continuing from crc"""
+    t = CRC8_TABLE
+    for b in data:
+        crc = t[crc ^ b]
+    return crc
+
+def crc16(data, crc: int=0) -> int:
+    """CRC16 (not inverted) of data, continuing from crc"""
+    lo = CRC16_LO
+    hi = CRC16_HI
+    for b in data:
+        i = (crc ^ b) & 0xFF
+        crc = (crc >> 8) ^ (hi[i] << 8 | lo[i])
+    return crc
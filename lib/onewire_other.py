@@ -9,6 +9,7 @@ Device support for other OneWire devices
 #__repo__ = "https://github.com/CanyonCasa/Custom-Node-Red-Nodes"
 
 from onewire import OneWireBus, Device
+from onewire_crc import crc16
 from onewire_ports import OneWirePort 
 from onewire_temps import TemperatureSensor 
 
@@ -17,6 +18,7 @@ class DS2423(Device):
     """Device support for DS2423 OneWire 4kb RAM and counter."""
 
     # device specific constants...
+    __slots__ = ('counts',)
     CATEGORY = 'counter'
     FAMILY = 0x1D
     DESC = 'DS2423 (0x1D) OneWire 4kb RAM and counter'
@@ -25,47 +27,165 @@ class DS2423(Device):
     SCRATCHPADD_COPY = 0x5A
     MEMORY_READ = 0xF0
     MEMORY_READ_AND_COUNTER = 0xA5
+    PAGE_SIZE = 32
+    COUNTER_PAGES = (12, 13, 14, 15)    # pages with a counter, read together
+    COUNTERS = ('c12', 'c13', 'A', 'B') # A and B count the external inputs; c12 and c13 writes to their pages
+    PAGE_READ = 42  # bytes per page read: data, 4 byte counter, 4 zero bytes, and inverted CRC16
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
-        super().__init__(bus, address)
-        self.CATEGORY = DS2423.CATEGORY
-        self.DESC = DS2423.DESC
-        self.desc = params.get('desc',DS2423.DESC)
+        super().__init__(bus, address, params)
+        self.counts = None  # counts last reported, for changed only replies
+
+    def counters(self) -> list:
+        """Reads all counter pages in one selected transaction (read memory and counter continues page to
+           page); each page is verified by its CRC16. Returns the counts in COUNTERS order or None"""
+        start = DS2423.COUNTER_PAGES[0] * DS2423.PAGE_SIZE
+        cmd = bytes((DS2423.MEMORY_READ_AND_COUNTER, start & 0xFF, start >> 8))
+        self.select()
+        self.bus.write(cmd)
+        buf = self.bus.read(DS2423.PAGE_READ * len(DS2423.COUNTER_PAGES))
+        self.bus.reset()
+        pages = memoryview(buf)
+        seed = crc16(cmd)   # first page CRC also covers the command and address
+        counts = []
+        for i in range(0, len(buf), DS2423.PAGE_READ):
+            if self.bus.crc16check(pages[i:i+DS2423.PAGE_READ], seed):
+                return None
+            seed = 0
+            n = i + DS2423.PAGE_SIZE
+            counts.append(buf[n] | buf[n+1]<<8 | buf[n+2]<<16 | buf[n+3]<<24)
+        return counts
+
+    def action(self, info: dict) -> dict:
+        """Reads the counters; changed returns only those that differ from the last reply"""
+        counts = self.counters()
+        if counts==None:
+            return { 'err': 'counter read failed CRC' }
+        counts = dict(zip(DS2423.COUNTERS, counts))
+        last = self.counts
+        self.counts = counts
+        if info.get('changed') and last:
+            counts = { k: v for k, v in counts.items() if last.get(k)!=v }
+        return { 'counters': counts }
 
 Device.register(DS2423.FAMILY,DS2423)
 
 class DS2438(Device):
     """Device support for DS2438 OneWire Battery Gauge"""
 
+    __slots__ = ('units', 'rsens', 'vdd', 'configured')
     CATEGORY = 'gauge'
     FAMILY = 0x26
     DESC = 'DS2438 (0x26) Battery Gauge'
+    CONVERT_T = 0x44    # same code as TemperatureSensor, so a bus wide CONVERT_T starts gauges too
+    CONVERT_V = 0xB4
+    RECALL = 0xB8       # page to scratchpad; page follows each memory command
+    RD_SCRATCH = 0xBE
+    WR_SCRATCH = 0x4E
+    COPY_SCRATCH = 0x48
+    IAD = 0x01          # config: current A/D on
+    AD = 0x08           # config: voltage A/D input VDD, else VAD
+    CONVERT_WAIT = 10   # ms, temperature and voltage conversions
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
-        super().__init__(bus, address)
-        self.CATEGORY = DS2438.CATEGORY
-        self.DESC = DS2438.DESC
-        self.desc = params.get('desc',DS2438.DESC)
+        super().__init__(bus, address, params)
+        units = params.get('units','').upper()
+        self.units = units if units in ['F','C','K','R','X','-'] else 'F'
+        self.rsens = params.get('rsens')    # current sense resistor (ohms); reports amps, else raw counts
+        self.vdd = params.get('source','vdd')!='vad'    # voltage input
+        self.configured = False
+
+    def page_read(self, page: int=0) -> bytearray:
+        """Recalls a page to the scratchpad and reads it; None on a CRC failure"""
+        self.select()
+        self.bus.write([DS2438.RECALL, page])
+        self.select()
+        self.bus.write([DS2438.RD_SCRATCH, page])
+        buf = self.bus.read(9)
+        if self.bus.crc8(buf):
+            return None
+        return buf[0:8]
+
+    def configure(self):
+        """Turns on the current A/D and selects the voltage input; only writes when they differ.
+           Returns True if written, False if already set, None if page 0 could not be read"""
+        sp = self.page_read(0)
+        if sp==None:
+            return None
+        cfg = sp[0] & ~(DS2438.IAD | DS2438.AD) | DS2438.IAD | (DS2438.AD if self.vdd else 0)
+        self.configured = True
+        if sp[0]==cfg:
+            return False
+        self.select()
+        self.bus.write([DS2438.WR_SCRATCH, 0, cfg])
+        self.select()
+        self.bus.write([DS2438.COPY_SCRATCH, 0])
+        return True
+
+    def convert(self) -> int:
+        """Starts temperature and voltage conversions and returns the time (ms) until they complete"""
+        if not self.configured:
+            self.configure()
+        self.select()
+        self.bus.write([DS2438.CONVERT_T])
+        self.select()
+        self.bus.write([DS2438.CONVERT_V])
+        return DS2438.CONVERT_WAIT
+
+    @staticmethod
+    def convert_all(bus: OneWireBus, gauges: list) -> int:
+        """Starts voltage conversions on all bus gauges via SKIP ROM; temperature conversions start with
+           the bus wide CONVERT_T (see TemperatureSensor.convert_all). Returns the wait (ms)"""
+        bus.speed(False)
+        if not gauges or bus.reset():
+            return 0
+        bus.skip()
+        bus.writebyte(DS2438.CONVERT_V)
+        return DS2438.CONVERT_WAIT
+
+    @property
+    def wait(self) -> int:
+        """Fixed conversion wait (ms), read alongside sensor waits for a bus wide conversion"""
+        return DS2438.CONVERT_WAIT
+
+    def deadline(self) -> int:
+        return DS2438.CONVERT_WAIT
+
+    def read_raw(self) -> bytes:
+        """Raw temperature, voltage, and current registers (2 bytes each, LSB first); None on failure"""
+        page = self.page_read(0)
+        return None if page==None else bytes(page[1:7])
+
+    def values(self, raw: bytes, units=None) -> dict:
+        """Reply fields for raw registers: temperature (in units, at DS18X20 resolution), volts, current"""
+        if raw==None:
+            return { 'err': 'gauge read failed CRC' }
+        units = units or self.units
+        t = raw[1]<<8 | raw[0]  # 1/256 C, 13 significant bits
+        i = raw[5]<<8 | raw[4]
+        i = i - 65536 if i & 0x8000 else i
+        return { 'temperature': TemperatureSensor.temp_as((t - 65536 if t & 0x8000 else t) >> 4 & 0xFFFF, units),
+            'units': units, 'voltage': (raw[3]<<8 | raw[2]) / 100,
+            'current': i / (4096 * self.rsens) if self.rsens else i }
 
 Device.register(DS2438.FAMILY,DS2438)
 
 
-### DOES NOT SUPPORT CHAIN AND PORT FUNCTIONS AT THIS TIME!
+### DOES NOT SUPPORT PORT FUNCTIONS AT THIS TIME! Chain discovery by OneWireBus.chain
 class DS28EA00(TemperatureSensor,OneWirePort):
 
     # Device specific definitions
+    __slots__ = ('mask', 'shadow', 'synced', 'resync')
     CATEGORY = 'multifunction'
     FAMILY = 0x42
+    OVERDRIVE = True
+    RESUME = True
     DESC = 'DS28EA00 (0x42) Chainable Temperature Sensor w/PIO'
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
-        params['desc'] = params.get('desc',DS28EA00.DESC)
         super().__init__(bus, address, params)
-        self.CATEGORY = DS28EA00.CATEGORY
-        self.DESC = DS28EA00.DESC
-        self.desc = params.get('desc',DS28EA00.DESC)
 
 Device.register(DS28EA00.FAMILY, DS28EA00)
 
@@ -74,6 +194,7 @@ Device.register(DS28EA00.FAMILY, DS28EA00)
 class DS28E04(OneWirePort):
     """Device support for DS28E04 4Kb Addressable EEPROM w/PIO"""
 
+    __slots__ = ('mask', 'shadow', 'synced', 'resync')
     CATEGORY = 'eeprom'
     FAMILY = 0x1C
     DESC = 'DS28E04 (0x1C) 4kb EEPROM w/PIO'
@@ -84,10 +205,7 @@ class DS28E04(OneWirePort):
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
-        super().__init__(bus, address)
-        self.CATEGORY = DS28E04.CATEGORY
-        self.DESC = DS28E04.DESC
-        self.desc = params.get('desc',DS28E04.DESC)
+        super().__init__(bus, address, params)
 
 Device.register(DS28E04.FAMILY,DS28E04)
 
@@ -8,27 +8,30 @@ Device support for OneWire port (I/O) devices
 #__version__ = "0.0.0-auto.0"
 #__repo__ = "https://github.com/CanyonCasa/Custom-Node-Red-Nodes"
 
-from onewire import OneWireBus, Device
+from onewire import OneWireBus, Device, millis
+from onewire_crc import crc16
 
 
 class OneWirePort(Device):
 
+    # no slots of its own so it can mix with TemperatureSensor (i.e. DS28EA00);
+    # concrete port classes declare the 'mask', 'shadow', 'synced', and 'resync' slots
+    __slots__ = ()
     CATEGORY = 'port'
     PORT_MASK = 0xFF
     PORT_READ = 0xF5
     PORT_READ_REG_SEQ = []  # port type specific sequence 
     PORT_WRITE_REG = 0x5A
     PORT_INTERLEAVE = False
+    RESYNC = 60000  # ms a shadow latch is trusted before modify ops reread the latch register
 
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
         super().__init__(bus, address, params)
-        self.CATEGORY = OneWirePort.CATEGORY
-        self.PORT_MASK = OneWirePort.PORT_MASK
-        self.PORT_READ = OneWirePort.PORT_READ
-        self.PORT_READ_REG_SEQ = OneWirePort.PORT_READ
-        self.PORT_WRITE_REG = OneWirePort.PORT_WRITE_REG
-        self.PORT_INTERLEAVE = OneWirePort.PORT_INTERLEAVE
+        self.mask = params.get('port_mask',self.PORT_MASK)   # per instance override of the family port mask
+        self.shadow = None  # last verified latch state (masked), i.e. read or confirmed written; None when unknown
+        self.synced = 0     # ms when shadow was last read from, or confirmed by, the device
+        self.resync = params.get('resync',self.RESYNC)  # ms; 0 rereads the latch before every modify op
     
     # low level port I/O function to retrieve the RAW port pin states (i.e. no inversion handling)
     def portIn(self, raw=False):
@@ -41,35 +44,53 @@ class OneWirePort(Device):
             return data
         if self.PORT_INTERLEAVE:
             data = ((data & 0x04)>>1) + ((data & 0x01))
-        return data & self.PORT_MASK
+        return data & self.mask
 
     def portReadReg(self):
         if self.PORT_INTERLEAVE:
             data = self.portIn(True)
             data = ((data & 0x08)>>2) + ((data & 0x02)>>1)
-            return data & self.PORT_MASK
+            return self.sync(data & self.mask)
         self.select()
         self.bus.write(self.PORT_READ_REG_SEQ)
         response = self.bus.read(1)
         self.bus.reset()
         print(f"portReadReg: ",response)
-        return response[0] & self.PORT_MASK
+        return self.sync(response[0] & self.mask)
+
+    def sync(self, latch):
+        """Records a verified latch state as the shadow"""
+        self.shadow = latch
+        self.synced = millis()
+        return latch
+
+    def latch(self):
+        """Latch state for modify ops: the shadow while fresh, else reread from the device"""
+        if self.shadow==None or millis() - self.synced >= self.resync:
+            return self.portReadReg()
+        return self.shadow
 
     # sets the RAW (i.e. no inversion handling) port latch state data
     def portWriteReg(self, data):
         # mask data and fill bits...
-        data = (data & self.PORT_MASK) | (~self.PORT_MASK & 0xFF)
+        data = (data & self.mask) | (~self.mask & 0xFF)
         self.select()
         self.bus.write([self.PORT_WRITE_REG,data,data^0xFF])
         response = self.bus.read(2)
         self.bus.reset()    # required to stop command
         print(f"portWriteReg: ",response)
         if not response[0]==0xAA:
+            self.bus.last = None    # no confirmation, so session uncertain; rematch next time
+            self.shadow = None      # latch state unknown
+            if self.od:     # retry once at standard speed
+                self.fallback()
+                return self.portWriteReg(data)
             return None
+        self.sync(data & self.mask)  # confirmed, so the latch holds what was written
         data = response[1]
         if self.PORT_INTERLEAVE:
             data = ((data & 0x08)>>2) + ((data & 0x02)>>1)
-        return data & self.PORT_MASK
+        return data & self.mask
 
     # high-level DS2408, DS2413, or DS28EA00 port operations with error checking...
     # gets or sets port latch or pin data per operation. Assumes...
@@ -77,15 +98,17 @@ class OneWirePort(Device):
     #   wIOIN and wIOREG do not change the port 
     #   wIOSET, wIOCLEAR, and wIOTOGGLE operations preserve bits with 0 value and only change 1 bits
     #   wIORESET, wIOOUT do not preserve bits and write all bits of the port, both 0's and 1's.
+    #   SET, CLEAR, TOGGLE, and PULSE modify the shadow latch, so need only the write transaction(s);
+    #   REG always reads the device and so also resyncs the shadow
     def port(self, op, data=0xFF):
         print(f"op: {op}, data: {data}")
         if type(data)=='str': data = int(data,16) # hex string to decimal
         if op == 'RESET':
-            data = self.portWriteReg(self.PORT_MASK)
+            data = self.portWriteReg(self.mask)
         elif op == 'CLEAR':
-            data = self.portWriteReg(data | self.portReadReg())
+            data = self.portWriteReg(data | self.latch())
         elif op == 'SET':
-            data = self.portWriteReg(~data & self.portReadReg())
+            data = self.portWriteReg(~data & self.latch())
         elif op == 'IN':
             data = self.portIn()
         elif op == 'REG':
@@ -93,12 +116,14 @@ class OneWirePort(Device):
         elif op == 'OUT':
             data = self.portWriteReg(~data)  # inverts?
         elif op == 'TOGGLE':
-            data = self.portWriteReg(data ^ self.portReadReg())
+            data = self.portWriteReg(data ^ self.latch())
         elif op == 'PULSE':
-            data = self.portWriteReg(data ^ self.portWriteReg(data ^ self.portReadReg()))
+            if self.portWriteReg(data ^ self.latch())==None:
+                return None
+            data = self.portWriteReg(data ^ self.latch())
         else:
             return None
-        return self.PORT_MASK & ~data
+        return self.mask & ~data
 
     def action(self, info: dict) -> int:
         """parses input data record into a value and/or action for port call"""
@@ -131,19 +156,71 @@ class DS2408(OneWirePort):
     """Device support for DS2408 8-bit I/O port."""
 
     # device specific constants...
+    __slots__ = ('mask', 'shadow', 'synced', 'resync')
     FAMILY = 0x29
+    OVERDRIVE = True
+    RESUME = True
     DESC = 'DS2408 (0x29) 8-bit I/O port'
     PORT_MASK = 0xFF
     PORT_READ_REG_SEQ = [0xF0,0x89,0x00]  # port type specific sequence 
+    READ_REGS = 0xF0        # read PIO registers 0x88-0x8F: pins, latch, activity, cs mask, cs polarity, control
+    WRITE_CS_REGS = 0xCC    # write conditional search registers 0x8B-0x8D
+    RESET_ACTIVITY = 0xC3   # clears activity latches, 0xAA confirms
+    CS_ACTIVITY = 0x01      # control PLS: conditional search on activity latches rather than pin states
+    CS_AND = 0x02           # control CT: all selected channels must match, else any
 
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
         super().__init__(bus, address, params)
-        self.DESC = DS2408.DESC
-        self.desc = params.get('desc',DS2408.DESC)
-        self.PORT_READ_REG_SEQ = DS2408.PORT_READ_REG_SEQ
-        self.PORT_MASK = params.get('port_mask',DS2408.PORT_MASK)
+
+    def registers(self):
+        """Reads the eight PIO registers (0x88-0x8F) in one transaction; None on a CRC failure"""
+        self.select()
+        cmd = bytes((DS2408.READ_REGS, 0x88, 0x00))
+        self.bus.write(cmd)
+        regs = self.bus.read(10)    # registers and inverted CRC16
+        self.bus.reset()
+        if self.bus.crc16check(regs, crc16(cmd)):
+            return None
+        self.sync(regs[1] & self.mask)  # latch register refreshes the shadow for free
+        return regs[:8]
+
+    def conditional(self, mask: int, polarity: int=0xFF, activity: bool=True, conjunction: bool=False) -> bool:
+        """Sets the conditional search registers so the device answers conditional (alarm) search when
+           selected channels (mask) match polarity; by default when any selected channel's activity latch
+           is set, i.e. its input changed since the latches were last reset. True when read back matches"""
+        regs = self.registers()
+        if regs==None:
+            return False
+        ctrl = regs[5] & 0x04 | (DS2408.CS_ACTIVITY if activity else 0) | (DS2408.CS_AND if conjunction else 0)
+        cs = bytes((mask & 0xFF, polarity & 0xFF, ctrl))
+        if not self.cs_match(regs, cs):
+            self.select()
+            self.bus.write(bytes((DS2408.WRITE_CS_REGS, 0x8B, 0x00)) + cs)
+            self.bus.reset()
+            regs = self.registers()
+        return regs!=None and self.cs_match(regs, cs)
+
+    @staticmethod
+    def cs_match(regs, cs) -> bool:
+        """Compares only writable conditional search bits; control bits 3-7 (e.g. VCCP, PORL) are read only"""
+        return regs[3:5]==cs[0:2] and regs[5] & 0x07 == cs[2] & 0x07
+
+    def activity(self, reset: bool=True):
+        """Reads (raw) pin states and activity latches in one transaction, then optionally resets the
+           latches (by RESUME where supported); returns (pins, activity) or None"""
+        regs = self.registers()
+        if regs==None:
+            return None
+        if reset and regs[2]:
+            self.select()
+            self.bus.writebyte(DS2408.RESET_ACTIVITY)
+            ok = self.bus.readbyte()==0xAA
+            self.bus.reset()
+            if not ok:
+                return None
+        return regs[0], regs[2]
 
 Device.register(DS2408.FAMILY,DS2408)
 
@@ -152,7 +229,10 @@ class DS2413(OneWirePort):
     """Device support for DS2413 2-bit I/O port."""
 
     # device specific constants...
+    __slots__ = ('mask', 'shadow', 'synced', 'resync')
     FAMILY = 0x3A
+    OVERDRIVE = True
+    RESUME = True
     DESC = 'DS2413 (0x3A) 2-bit I/O port'
     PORT_MASK = 0x03
     PORT_INTERLEAVE = True
@@ -160,11 +240,6 @@ class DS2413(OneWirePort):
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
         super().__init__(bus, address, params)
-        self.DESC = DS2413.DESC
-        self.desc = params.get('desc',DS2413.DESC)
-        self.PORT_MASK = params.get('port_mask',DS2413.PORT_MASK)
-        self.PORT_INTERLEAVE = DS2413.PORT_INTERLEAVE
-        self.DESC = DS2413.DESC
 
 Device.register(DS2413.FAMILY,DS2413)
 
@@ -8,17 +8,20 @@ Device support for OneWire temperature sensors
 #__version__ = "0.0.0-auto.0"
 #__repo__ = "https://github.com/CanyonCasa/Custom-Node-Red-Nodes"
 
-from onewire import OneWireBus, Device
-from time import sleep
+from onewire import OneWireBus, Device, millis
 
 class TemperatureSensor(Device):
 
+    __slots__ = ('bits', 'units', 'th', 'tl', 'configured', 'wait', 'observed', 'slowest', 'last', 'retry')
     CATEGORY = 'temperature'
     TEMP_CONVERT_WAIT = 800 # ms @ 12 bits
     CONVERT_T = 0x44
     RD_SCRATCH = 0xBE
     WR_SCRATCH = 0x4E
     COPY_SCRATCH = 0x48
+    RD_POWER = 0xB4
+    CONFIG_RETRY = 60000    # ms before a conversion retries a failed configuration
+    FAST_STEP = 160     # 1/16 C; largest change between fast reads accepted without a full read (10 C)
     
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
         super().__init__(bus, address, params)
@@ -26,9 +29,14 @@ class TemperatureSensor(Device):
         self.bits = bits if bits in [9,10,11,12] else 12   # vaildate, default 12
         units = params.get('units','').upper()
         self.units = units if units in ['F','C','K','R','X','-'] else 'F'  # valudate, default F
-        self.resolution(self.bits)  # set resolution
+        self.th = params.get('th')  # optional alarm limits (C)
+        self.tl = params.get('tl')
+        self.configured = False     # resolution/alarms applied lazily or by a bus wide configure_all pass
+        self.retry = 0      # ms before which conversions do not retry a failed configuration
         self.wait = TemperatureSensor.TEMP_CONVERT_WAIT >> (12-self.bits)
-        self.CATEGORY = TemperatureSensor.CATEGORY
+        self.observed = None    # last observed conversion time (ms), via read slot polling
+        self.slowest = 0        # slowest observed conversion time (ms)
+        self.last = None        # last verified temperature (signed 1/16 C), reference for fast reads
 
     def scratchpad_copy(self):
         self.select()
@@ -39,72 +47,185 @@ class TemperatureSensor(Device):
         self.bus.write([TemperatureSensor.RD_SCRATCH])
         sp_and_crc = self.bus.read(9)
         if self.bus.crc8(sp_and_crc):
+            self.bus.crc_errors += 1
             return bytearray(8)
         return sp_and_crc[0:8]
 
+    def scratchpad_temp(self) -> int:
+        """Reads only the temperature bytes, then a reset ends the read; unverified (no CRC)"""
+        self.select()
+        self.bus.write([TemperatureSensor.RD_SCRATCH])
+        buf = self.bus.read(2)
+        self.bus.reset()
+        self.bus.fast_reads += 1
+        return (buf[1]<<8) + buf[0]
+
+    def plausible(self, raw: int) -> bool:
+        """Checks an unverified reading: not all ones (no response), within the sensor range (-55 to 125 C),
+           and within FAST_STEP of the last verified reading; so the power-on value (85 C) passes only
+           when the sensor was already near 85 C"""
+        if raw==0xFFFF:
+            return False
+        t = raw - 65536 if raw & 0x8000 else raw
+        return -880 <= t <= 2000 and abs(t - self.last) <= TemperatureSensor.FAST_STEP
+
     def scratchpad_write(self, buf: bytearray) -> None:
         self.select()
         self.bus.write([TemperatureSensor.WR_SCRATCH])
         self.bus.write(buf)
     
+    # converts raw temperature to specified format
+    @staticmethod
+    def temp_as(raw: int, units: str = '') -> float:
+        temp = raw if raw<32768 else raw - 65536
+        if units == 'C':
+            return temp / 16
+        elif units == 'F':
+            return (temp / 16) * 1.8 + 32
+        elif units == 'K':
+            return (temp / 16) + 273.15
+        elif units == 'R':
+            return (temp / 16) * 1.8 + 491.67
+        elif units == 'X':
+            return "0x{:04X}".format(raw)
+        else:
+            return { t:TemperatureSensor.temp_as(raw,t) for t in 'CFKRX' }
+
+    def convert(self) -> int:
+        """Starts a conversion and returns the time (ms) until it completes"""
+        if not self.configured and millis() >= self.retry:
+            self.configure()
+        self.select()
+        self.bus.write([TemperatureSensor.CONVERT_T])
+        return self.wait
+
+    @staticmethod
+    def convert_all(bus: OneWireBus, sensors: list) -> int:
+        """Starts a conversion on all bus sensors via SKIP ROM; returns the wait (ms) for the slowest resolution"""
+        bus.speed(False)    # broadcast at standard speed reaches every sensor
+        if not sensors or bus.reset():
+            return 0
+        bus.skip()
+        bus.writebyte(TemperatureSensor.CONVERT_T)
+        return max([s.wait for s in sensors])
+
+    @staticmethod
+    def parasite_powered(bus: OneWireBus) -> bool:
+        """READ POWER SUPPLY via SKIP ROM; True if any sensor pulls the read slot low (parasite powered),
+           or if no device answers the reset, so the bus is not assumed externally powered; a DS2438
+           takes the command as CONVERT_V, which only refreshes its voltage register"""
+        bus.speed(False)
+        if bus.reset():
+            return True
+        bus.skip()
+        bus.writebyte(TemperatureSensor.RD_POWER)
+        return not bus.readbit()
+
+    def done(self) -> bool:
+        """Polls a read time slot after CONVERT_T; an externally powered sensor returns 1 once converted"""
+        return self.bus.readbit()
+
+    def wait_done(self) -> bool:
+        """Blocks until the sensor reports completion or the fixed wait expires"""
+        start = millis()
+        while millis() - start < self.wait:
+            if self.done():
+                self.observe(millis() - start)
+                return True
+        return False
+
+    def observe(self, ms: int) -> None:
+        """Records an observed conversion time"""
+        self.observed = ms
+        if ms > self.slowest:
+            self.slowest = ms
+
+    def deadline(self) -> int:
+        """Learned conversion time (ms): slowest observed plus 25% margin, bounded by the fixed wait"""
+        if not self.slowest:
+            return self.wait
+        return min(self.wait, self.slowest + (self.slowest >> 2) + 1)
+
+    def read_raw(self) -> int:
+        """Loads scratchpad and extracts the raw temperature of the last conversion. In the bus' fast mode
+           reads only the temperature bytes (16 rather than 72 slots), falling back to a full, CRC checked
+           read when the value is implausible; without a verified reading to compare, reads in full"""
+        if self.bus.fast and self.last!=None:
+            raw = self.scratchpad_temp()
+            if self.plausible(raw):
+                self.last = raw - 65536 if raw & 0x8000 else raw
+                return raw
+            self.bus.fast_suspect += 1
+        buf = self.scratchpad_read()
+        raw = (buf[1]<<8) + buf[0]
+        if buf[4] & 0x1F == 0x1F:   # reserved config bits read as 1; failed CRC returns zeros
+            self.last = raw - 65536 if raw & 0x8000 else raw
+        return raw
+
+    def read(self, units=None) -> float:
+        return self.temp_as(self.read_raw(),(units,self.units)[units==None])
+
     def temperature(self, units=None, wait=False) -> float:
-        # converts raw temperature to specified format
-        def temp_as(raw: int, units: str = '') -> float:
-            temp = raw if raw<32768 else raw - 65536
-            if units == 'C':
-                return temp / 16
-            elif units == 'F':
-                return (temp / 16) * 1.8 + 32
-            elif units == 'K':
-                return (temp / 16) + 273.15
-            elif units == 'R':
-                return (temp / 16) * 1.8 + 491.67
-            elif units == 'X':
-                return "0x{:04X}".format(raw)
-            else:
-                return { t:temp_as(raw,t) for t in 'CFKRX' }
-        # load scratchpad and extract temperature
-        def getT(units):
-            self.select()
-            buf = self.scratchpad_read()
-            raw_temp = (buf[1]<<8) + buf[0]
-            return temp_as(raw_temp,(units,self.units)[units==None])
         if self.bus.busy:
             if self.bus.ready:  # conversion ready
-                return getT(units)
+                return self.read(units)
             else:
                 return None
         else:   # not busy, so can start conversion
-            self.select()
-            self.bus.write([TemperatureSensor.CONVERT_T])
-            if wait:    # blocking to other functions
-                sleep(self.wait)
-                return getT(units)
+            self.convert()
+            if wait:    # blocking to other functions, but done as soon as the sensor reports completion
+                self.wait_done()
+                return self.read(units)
             else:       # non-blocking, but bus not usable until ready
                 self.bus.hold(self.wait)
                 return None
 
     # sets a temperature resolution
     def resolution(self, bits: int) -> int:
-        self.select()
+        self.bits = bits
+        self.wait = TemperatureSensor.TEMP_CONVERT_WAIT >> (12-self.bits)
+        self.observed = None    # conversion times observed at the old resolution no longer apply
+        self.slowest = 0
+        self.configure()
+        return bits
+
+    # sets alarm limits (integer C; None leaves a limit unchanged) used by alarm search
+    def limits(self, th=None, tl=None) -> tuple:
+        if th!=None: self.th = th
+        if tl!=None: self.tl = tl
+        self.configure()
+        return self.th, self.tl
+
+    def configure(self):
+        """Applies resolution and alarm limits; only writes and copies to EEPROM when they differ.
+           Returns True if written, False if already set, None if the scratchpad could not be read"""
         sp = self.scratchpad_read()
-        cfg = (bits-9) << 5 | 0x1F
-        buf = bytearray([sp[2], sp[3], cfg])
-        self.scratchpad_write(buf)
+        if sp[4] & 0x1F != 0x1F:    # reserved config bits read as 1; failed CRC returns zeros
+            self.retry = millis() + TemperatureSensor.CONFIG_RETRY
+            return None
+        cfg = (self.bits-9) << 5 | 0x1F
+        if self.th==None:   # adopt limits already on the sensor
+            self.th = sp[2] - 256 if sp[2] & 0x80 else sp[2]
+        if self.tl==None:
+            self.tl = sp[3] - 256 if sp[3] & 0x80 else sp[3]
+        th = int(self.th) & 0xFF
+        tl = int(self.tl) & 0xFF
+        self.configured = True
+        if sp[2]==th and sp[3]==tl and sp[4]&0x60==cfg&0x60:
+            return False
+        self.scratchpad_write(bytearray([th, tl, cfg]))
         self.scratchpad_copy()
-        return bits
+        return True
 
 
 class DS18X20(TemperatureSensor):
     # Device specific definitions
+    __slots__ = ()
     FAMILY = 0x28
     DESC = 'DS18x20 (0x28) Temperature Sensor'
 
     def __init__(self, bus: OneWireBus, address: bytearray, params: dict={}):
         if __class__.FAMILY != address[0]: raise(f"Device {address} not of type {__class__.__name__}")
         super().__init__(bus, address, params)
-        params['desc'] = params.get('desc',DS18X20.DESC)
-        self.DESC = DS18X20.DESC
-        self.desc = params.get('desc',DS18X20.DESC)
 
 Device.register(DS18X20.FAMILY, DS18X20)
@@ -0,0 +1,282 @@
+# MIT License
+"""
+`onewire_transport`
+====================================================
+Transport backends beneath OneWireBus. A transport provides the bus primitives...
+    reset(test)             bus reset; returns True when NO device presence (or stuck bus if test)
+    read_bit(), write_bit() single time slots
+    write_bytes(buf)        writes a block (any sequence of ints), LSB first
+    read_into(buf)          fills a bytearray from the bus, LSB first
+    triplet(direction)      search step: reads bit and complement, writes the bit taken,
+                            direction (i.e. seed bit) on a conflict; returns (bit, complement, taken)
+    speed(overdrive)        optional; sets master speed (standard or overdrive), True if supported;
+                            backends without it run standard speed only
+so OneWireBus and devices only work at byte/block level. Backends...
+    BitBangTransport:       onewireio core module (or any object with reset/read_bit/write_bit);
+                            standard speed only, as onewireio has fixed timing
+    emulate1wIO.OneWire:    host emulator, implements the same interface
+A faster backend (e.g. an RP2040 PIO program clocking whole bytes) need only implement the
+same methods and be passed to OneWireBus(pin, transport)
+Recorder wraps any transport (see OneWireBus.record) to log transactions for bit slot accounting
+and replay against another transport (e.g. the emulator)
+
+* Author(s): CanyonCasa
+"""
+
+from time import monotonic_ns
+
+RESET_US = (960, 96)    # estimated wire time (us) per reset, standard and overdrive
+SLOT_US = (70, 10)      # estimated wire time (us) per time slot, standard and overdrive
+
+class BitBangTransport:
+    """Byte and block primitives over bit level reset/read_bit/write_bit calls"""
+
+    def __init__(self, pin=None, io=None):
+        self.pin = pin
+        if io==None:
+            from onewireio import OneWire
+            io = OneWire(pin)
+        self.io = io
+
+    def reset(self, test: bool=False) -> bool:
+        # patch until reset stuck low fix to onewireio reset
+        if test and self.pin!=None:
+            import digitalio
+            from onewireio import OneWire
+            self.io.deinit()
+            x = digitalio.DigitalInOut(self.pin)
+            state = x.value
+            x.deinit()
+            self.io = OneWire(self.pin)
+            if not state:
+                return True # bus stuck low failure
+        return self.io.reset()
+
+    def read_bit(self) -> bool:
+        return self.io.read_bit()
+
+    def write_bit(self, bit) -> None:
+        self.io.write_bit(bit)
+
+    def write_bytes(self, buf) -> None:
+        wb = self.io.write_bit  # bound once per block, not per bit
+        for value in buf:
+            for i in range(8):
+                wb((value >> i) & 1)
+
+    def read_into(self, buf: bytearray) -> bytearray:
+        rb = self.io.read_bit
+        for n in range(len(buf)):
+            val = 0
+            for i in range(8):
+                if rb():
+                    val |= 1 << i
+            buf[n] = val
+        return buf
+
+    def triplet(self, direction: int) -> tuple:
+        rb = self.io.read_bit
+        bit = rb()
+        cmp = rb()
+        if bit and cmp:     # no devices participating
+            return 1, 1, 1
+        taken = (direction, 1 if bit else 0)[bit!=cmp]
+        self.io.write_bit(taken)
+        return bit, cmp, taken
+
+
+def hexs(data) -> str:
+    return "".join(["{:02x}".format(b) for b in data])
+
+
+class Recorder:
+    """Transport wrapper logging each transaction (a reset and the time slots after it) into a ring buffer
+       of records [ms, od, presence, ops]; presence is None for slots before the first reset, and ops is a
+       list of [code, bytearray] with consecutive ops of a kind merged: 'W' bytes written, 'R' bytes read,
+       'w' bits written, 'r' bits read, 't' triplets as direction<<3 | bit<<2 | complement<<1 | taken, and
+       'S' speed changes (1 overdrive), e.g. to overdrive after an overdrive match command"""
+
+    def __init__(self, transport, size: int=32):
+        self.transport = transport
+        self.size = size
+        self.log = []       # ring buffer of records
+        self.next = 0       # index of the oldest record once the ring is full
+        self.total = 0      # records made, including those overwritten
+        self.ops = None     # ops of the transaction in progress
+        self.od = 0
+        if hasattr(transport, 'speed'):     # only offer overdrive if the transport does
+            self.speed = self._speed
+
+    def _speed(self, overdrive: bool) -> bool:
+        self.od = 1 if overdrive else 0
+        self.op('S', (self.od,))
+        return self.transport.speed(overdrive)
+
+    def start(self, presence):
+        self.ops = []
+        record = [monotonic_ns() // 1000000, self.od, presence, self.ops]
+        if len(self.log) < self.size:
+            self.log.append(record)
+        else:
+            self.log[self.next] = record
+            self.next = (self.next + 1) % self.size
+        self.total += 1
+
+    def op(self, code: str, data) -> None:
+        if self.ops==None:
+            self.start(None)
+        if self.ops and self.ops[-1][0]==code:
+            self.ops[-1][1].extend(data)
+        else:
+            self.ops.append([code, bytearray(data)])
+
+    # transport interface...
+    def reset(self, test: bool=False) -> bool:
+        r = self.transport.reset(test)
+        self.start(0 if r else 1)
+        return r
+
+    def read_bit(self) -> bool:
+        bit = self.transport.read_bit()
+        self.op('r', (1 if bit else 0,))
+        return bit
+
+    def write_bit(self, bit) -> None:
+        self.transport.write_bit(bit)
+        self.op('w', (1 if bit else 0,))
+
+    def write_bytes(self, buf) -> None:
+        self.transport.write_bytes(buf)
+        self.op('W', buf)
+
+    def read_into(self, buf: bytearray) -> bytearray:
+        self.transport.read_into(buf)
+        self.op('R', buf)
+        return buf
+
+    def triplet(self, direction: int) -> tuple:
+        bit, cmp, taken = self.transport.triplet(direction)
+        self.op('t', ((direction & 1) << 3 | (1 if bit else 0) << 2 | (1 if cmp else 0) << 1 | taken,))
+        return bit, cmp, taken
+
+    # accounting...
+    def records(self) -> list:
+        """Records oldest first"""
+        return self.log[self.next:] + self.log[:self.next]
+
+    @staticmethod
+    def slots(ops: list) -> int:
+        n = 0
+        for code, data in ops:
+            if code in 'WR':
+                n += len(data) << 3
+            elif code=='t':     # no participants (bit and complement 1) ends a triplet after its reads
+                n += 3 * len(data) - len([1 for v in data if v & 6 == 6])
+            elif code!='S':
+                n += len(data)
+        return n
+
+    @staticmethod
+    def us(od: int, presence, ops: list) -> int:
+        """Estimated wire time (us) of a record at the speed(s) it ran"""
+        t = 0 if presence==None else RESET_US[od]
+        for op in ops:
+            if op[0]=='S':
+                od = op[1][-1]
+            else:
+                t += Recorder.slots((op,)) * SLOT_US[od]
+        return t
+
+    @staticmethod
+    def classify(ops: list, last=None) -> tuple:
+        """(device, operation, session device) of a transaction from its written bytes: device is a rom sn,
+           'all' (skip), or the rom command name; operation is the function command (hex), else the rom
+           command; last is the session device for RESUME"""
+        out = bytearray()
+        for code, data in ops:
+            if code=='W':
+                out.extend(data)
+                if len(out) > 9:
+                    break
+        if not out:
+            return None, 'reset', last
+        cmd = out[0]
+        if cmd in (0x55, 0x69) and len(out) >= 9:     # MATCH, OD MATCH
+            last = " ".join(["{:02X}".format(b) for b in out[1:9]])
+            return last, "{:02X}".format(out[9]) if len(out) > 9 else ('match', 'od match')[cmd==0x69], last
+        if cmd==0xA5:   # RESUME
+            return last, "{:02X}".format(out[1]) if len(out) > 1 else 'resume', last
+        if cmd in (0xCC, 0x3C):     # SKIP, OD SKIP
+            return 'all', "{:02X}".format(out[1]) if len(out) > 1 else ('skip', 'od skip')[cmd==0x3C], None
+        name = {0xF0: 'search', 0xEC: 'alarm search', 0x0F: 'chain', 0x33: 'read rom'}.get(cmd, "{:02X}".format(cmd))
+        return name, name, None
+
+    def stats(self) -> dict:
+        """Totals per device and per operation: transactions, resets, slots, and wire time (us) estimated
+           at standard (std) and overdrive (od) speed, and at the recorded speed (us)"""
+        devices = {}
+        ops = {}
+        last = None
+        for ms, od, presence, record in self.records():
+            device, op, last = self.classify(record, last)
+            slots = self.slots(record)
+            us = self.us(od, presence, record)
+            resets = 0 if presence==None else 1
+            for table, key in ((devices, device or 'none'), (ops, op)):
+                t = table.get(key)
+                if t==None:
+                    t = table[key] = {'n': 0, 'resets': 0, 'slots': 0, 'std': 0, 'od': 0, 'us': 0}
+                t['n'] += 1
+                t['resets'] += resets
+                t['slots'] += slots
+                t['std'] += resets * RESET_US[0] + slots * SLOT_US[0]
+                t['od'] += resets * RESET_US[1] + slots * SLOT_US[1]
+                t['us'] += us
+        return {'records': len(self.log), 'total': self.total, 'devices': devices, 'ops': ops}
+
+    def dump(self) -> list:
+        """Records oldest first in JSON friendly form, ops data as hex strings"""
+        return [[ms, od, presence, [[code, hexs(data)] for code, data in ops]]
+            for ms, od, presence, ops in self.records()]
+
+    @staticmethod
+    def load(dump: list) -> list:
+        """Records from a dump"""
+        return [[ms, od, presence, [[code, bytearray([int(data[i:i+2],16) for i in range(0,len(data),2)])]
+            for code, data in ops]] for ms, od, presence, ops in dump]
+
+
+def replay(records: list, transport) -> dict:
+    """Replays records (or a dump) against a transport, e.g. the emulator; reports transactions, slots, and
+       mismatches, i.e. presence, reads, or triplets that differ from those recorded"""
+    if [1 for r in records if r[3] and isinstance(r[3][0][1], str)]:  # a dump
+        records = Recorder.load(records)
+    report = {'transactions': 0, 'slots': 0, 'mismatches': 0}
+    for od, presence, ops in [r[1:] for r in records]:
+        if hasattr(transport, 'speed'):
+            transport.speed(od)
+        if presence!=None and (0 if transport.reset() else 1)!=presence:
+            report['mismatches'] += 1
+        for code, data in ops:
+            if code=='S':
+                if hasattr(transport, 'speed'):
+                    transport.speed(data[-1])
+            elif code=='W':
+                transport.write_bytes(data)
+            elif code=='R':
+                if transport.read_into(bytearray(len(data)))!=data:
+                    report['mismatches'] += 1
+            elif code=='w':
+                for bit in data:
+                    transport.write_bit(bit)
+            elif code=='r':
+                if bytearray([1 if transport.read_bit() else 0 for bit in data])!=data:
+                    report['mismatches'] += 1
+            else:
+                for v in data:
+                    bit, cmp, taken = transport.triplet(v >> 3)
+                    if (1 if bit else 0) << 2 | (1 if cmp else 0) << 1 | taken != v & 7:
+                        report['mismatches'] += 1
+        report['transactions'] += 1
+        report['slots'] += Recorder.slots(ops)
+    return report
@@ -1,9 +1,13 @@
+from metrics import metrics
+
 # general purpose event queue handler
 class Queue:
 
-    def __init__(self):
+    def __init__(self, name=None):
         self.n = 0      # number of queue pushes
         self.q = []     # queue data
+        self.metric = name  # optional metrics name for push count and depth high-water mark
+        self.depth = None if name==None else name+'.peak'
 
     @property
     def available(self):
@@ -22,6 +26,9 @@ class Queue:
             else:
                 self.q[index] = item
             self.n += 1
+            if self.metric:
+                metrics.count(self.metric)
+                metrics.peak(self.depth, len(self.q))
             return len(self.q)
         
 
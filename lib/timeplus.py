@@ -1,4 +1,7 @@
-import rtc
+try:
+    import rtc
+except ImportError:     # host (i.e. emulator) runs lack the RTC
+    rtc = None
 import time as timex
 from simpleq import Queue
 
@@ -29,7 +32,8 @@ class Zulutime:
             self.dst = tobj.get('dst',self.dst)
             epoch = tobj.get('epoch',timex.time())
         # initialize RTC with "local time" to be consistent with existing time class
-        rtc.RTC().datetime = timex.localtime(epoch+self.adjust)
+        if rtc:
+            rtc.RTC().datetime = timex.localtime(epoch+self.adjust)
 
     @property
     def epoch(self):